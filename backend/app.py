@@ -1,11 +1,17 @@
 """
 FastAPI backend for E-Tongue Dravya identification API
 """
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 import numpy as np
+import asyncio
+import hmac
 import sys
 import os
 
@@ -13,19 +19,37 @@ import os
 parent_dir = os.path.join(os.path.dirname(__file__), '..')
 sys.path.insert(0, os.path.abspath(parent_dir))
 
-from ml.preprocess import DataPreprocessor
-from ml.utils import load_model, extract_features
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 
 # Import auth utilities
 try:
-    from .auth import init_db, create_user, authenticate_user, generate_token, verify_token, get_user_by_id
+    from .auth import (
+        init_db, async_create_user, async_authenticate_user, generate_token, verify_token,
+        async_get_user_by_id, user_from_claims, auth_cache_stats, close_connections,
+        AuthBusy, AuthDatabaseError, AUTH_TRUST_TOKEN_CLAIMS
+    )
 except ImportError:
-    from auth import init_db, create_user, authenticate_user, generate_token, verify_token, get_user_by_id
+    from auth import (
+        init_db, async_create_user, async_authenticate_user, generate_token, verify_token,
+        async_get_user_by_id, user_from_claims, auth_cache_stats, close_connections,
+        AuthBusy, AuthDatabaseError, AUTH_TRUST_TOKEN_CLAIMS
+    )
 
-# Initialize database
-init_db()
+try:
+    from .predictors import ModelBundle, artifact_mtimes, artifacts_complete, load_bundle
+    from .inference import InferenceExecutor, InferenceQueueFull, InferenceTimeout, MicroBatcher
+    from .metrics import (
+        CallbackGauge, InstrumentedRoute, PROMETHEUS_CONTENT_TYPE, record_model_load,
+        render_metrics, stage_timer
+    )
+except ImportError:
+    from predictors import ModelBundle, artifact_mtimes, artifacts_complete, load_bundle
+    from inference import InferenceExecutor, InferenceQueueFull, InferenceTimeout, MicroBatcher
+    from metrics import (
+        CallbackGauge, InstrumentedRoute, PROMETHEUS_CONTENT_TYPE, record_model_load,
+        render_metrics, stage_timer
+    )
 
 # Security scheme for JWT
 security = HTTPBearer()
@@ -36,6 +60,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Count and time every request; must be set before the endpoints are declared
+app.router.route_class = InstrumentedRoute
+
 # CORS middleware for frontend access
 app.add_middleware(
     CORSMiddleware,
@@ -45,14 +72,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global variables for model and preprocessor
-model = None
-preprocessor = None
-model_metadata = None
+# Model, preprocessor, metadata and predictor currently served. Replaced as a
+# whole on reload; handlers read it once per request.
+model_bundle: Optional[ModelBundle] = None
+
+ML_DIR = os.path.join(os.path.dirname(__file__), '..', 'ml')
+
+# Poll the artifact files and reload when they change (0 disables)
+MODEL_WATCH_INTERVAL_SECONDS = float(os.getenv("MODEL_WATCH_INTERVAL_SECONDS", "0"))
+
+# Largest batch accepted by /predict/batch; bigger requests get 422
+PREDICT_BATCH_MAX_READINGS = int(os.getenv("PREDICT_BATCH_MAX_READINGS", "1000"))
+
+# Shared secret for admin endpoints, sent in the X-Admin-Token header (unset disables them)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Load the model after startup, so /health answers while it loads
+MODEL_LOAD_IN_BACKGROUND = os.getenv("MODEL_LOAD_IN_BACKGROUND", "false").lower() in ("1", "true", "yes")
+
+_reload_lock = asyncio.Lock()
+_model_watcher: Optional[asyncio.Task] = None
+_background_load: Optional[asyncio.Future] = None
+
+# Cold start breakdown in seconds, served at /api/startup
+startup_timings = {}
+
+# Bounded worker pool running CPU-bound inference off the event loop
+inference_executor = InferenceExecutor.from_env(ML_DIR)
+
+# Groups concurrent /predict calls into one model call per batch
+micro_batcher = MicroBatcher.from_env(inference_executor)
+
+CallbackGauge(
+    'etongue_inference_pending', 'Predictions running or queued on the inference executor',
+    lambda: inference_executor.pending
+)
 
 
 class SensorData(BaseModel):
     """Input model for sensor data"""
+    # Infinite or NaN values would make the model call fail for the whole batch
+    model_config = ConfigDict(allow_inf_nan=False)
+    
     ph: float = Field(..., description="pH value", ge=0, le=14)
     conductivity: float = Field(..., description="Conductivity value (S/m)", ge=0)
     temperature: float = Field(..., description="Temperature in Celsius", ge=0, le=100)
@@ -71,6 +132,22 @@ class PredictionResponse(BaseModel):
     model_name: str
 
 
+class BatchSensorData(BaseModel):
+    """Input model for a batch of sensor readings"""
+    readings: List[SensorData] = Field(
+        ...,
+        description="Sensor readings to classify, e.g. one upload from a lab station",
+        min_items=1,
+        max_items=PREDICT_BATCH_MAX_READINGS
+    )
+
+
+class BatchPredictionResponse(BaseModel):
+    """Response model for batch predictions"""
+    predictions: List[PredictionResponse]
+    model_name: str
+
+
 class HealthResponse(BaseModel):
     """Response model for health check"""
     status: str
@@ -80,58 +157,137 @@ class HealthResponse(BaseModel):
 
 def load_ml_artifacts():
     """Load ML model and preprocessor"""
-    global model, preprocessor, model_metadata
+    global model_bundle
     
     try:
-        ml_dir = os.path.join(os.path.dirname(__file__), '..', 'ml')
-        model_path = os.path.join(ml_dir, 'model.pkl')
-        preprocessor_path = os.path.join(ml_dir, 'preprocessor.pkl')
-        metadata_path = os.path.join(ml_dir, 'model_metadata.json')
-        
-        if not os.path.exists(model_path) or not os.path.exists(preprocessor_path):
-            print(f"Warning: Model files not found. API will return errors until model is trained.")
-            return False
-        
-        model = load_model(model_path)
-        preprocessor = DataPreprocessor()
-        preprocessor.load(preprocessor_path)
-        
-        # Load metadata if available
-        if os.path.exists(metadata_path):
-            import json
-            with open(metadata_path, 'r') as f:
-                model_metadata = json.load(f)
+        # Resolve the model type once, not on every request
+        model_bundle = load_bundle(ML_DIR)
+        startup_timings.update(model_bundle.timings)
+        record_model_load(model_bundle.timings)
         
         print("ML artifacts loaded successfully!")
         return True
     
+    except FileNotFoundError:
+        print(f"Warning: Model files not found. API will return errors until model is trained.")
+        record_model_load({}, success=False)
+        return False
+    
     except Exception as e:
         print(f"Error loading ML artifacts: {e}")
+        record_model_load({}, success=False)
         return False
 
 
+async def reload_model() -> ModelBundle:
+    """
+    Load and warm up new artifacts in the background, then swap them in
+    
+    Requests already running finish on the previous bundle. If loading fails
+    the previous bundle stays in service and the error is raised.
+    """
+    global model_bundle
+    
+    async with _reload_lock:
+        try:
+            bundle = await asyncio.get_running_loop().run_in_executor(None, load_bundle, ML_DIR)
+        except Exception:
+            record_model_load({}, success=False)
+            raise
+        model_bundle = bundle
+        record_model_load(bundle.timings)
+        
+        # Process workers hold their own copy of the model; start fresh ones
+        if inference_executor.kind == 'process':
+            inference_executor.restart()
+        
+        print(f"Model reloaded: {bundle.model_name}")
+        return bundle
+
+
+async def watch_model_files(interval: float):
+    """Reload the model when the artifact files change"""
+    last_seen = artifact_mtimes(ML_DIR)
+    failed = None
+    
+    while True:
+        await asyncio.sleep(interval)
+        mtimes = artifact_mtimes(ML_DIR)
+        
+        # Wait until the files stop changing, so a half-written training
+        # output is never loaded
+        if mtimes != last_seen:
+            last_seen = mtimes
+            continue
+        
+        current = model_bundle.mtimes if model_bundle is not None else None
+        if mtimes == current or mtimes == failed or not artifacts_complete(mtimes):
+            continue
+        
+        try:
+            await reload_model()
+        except Exception as e:
+            # Do not retry the same broken files every interval
+            failed = mtimes
+            print(f"Error reloading model: {e}")
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Load model on startup"""
+    """Initialize database and load model on startup"""
+    global _model_watcher, _background_load
     print("Starting E-Tongue API...")
-    load_ml_artifacts()
+    
+    started = time.perf_counter()
+    init_db()
+    startup_timings['db_init'] = time.perf_counter() - started
+    
+    if MODEL_LOAD_IN_BACKGROUND:
+        _background_load = asyncio.get_running_loop().run_in_executor(None, load_ml_artifacts)
+    else:
+        load_ml_artifacts()
+    
+    if MODEL_WATCH_INTERVAL_SECONDS > 0:
+        _model_watcher = asyncio.create_task(watch_model_files(MODEL_WATCH_INTERVAL_SECONDS))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop inference workers and close database connections"""
+    if _model_watcher is not None:
+        _model_watcher.cancel()
+    micro_batcher.shutdown()
+    inference_executor.shutdown()
+    close_connections()
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
+    bundle = model_bundle
     return HealthResponse(
-        status="healthy" if model is not None else "model_not_loaded",
-        model_loaded=model is not None,
-        model_name=model_metadata.get('model_name') if model_metadata else None
+        status="healthy" if bundle is not None else "model_not_loaded",
+        model_loaded=bundle is not None,
+        model_name=bundle.metadata.get('model_name') if bundle is not None and bundle.metadata else None
     )
 
 
+@app.get("/api/startup")
+async def get_startup_timings():
+    """Cold start breakdown: module import, database init, artifact load and warmup"""
+    return {
+        "timings": dict(startup_timings),
+        "total_seconds": sum(startup_timings.values()),
+        "model_loaded": model_bundle is not None,
+        "background_load": MODEL_LOAD_IN_BACKGROUND,
+    }
+
+
 @app.get("/api/status")
 async def get_status():
     """Simple status endpoint for refresh functionality"""
     return {
-        "status": "OK" if (model is not None and preprocessor is not None) else "ERROR"
+        "status": "OK" if model_bundle is not None else "ERROR"
     }
 
 
@@ -156,6 +312,23 @@ class TokenResponse(BaseModel):
     message: str
 
 
+def _overloaded_error(e: Exception) -> HTTPException:
+    """503 response telling the client to back off and retry"""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": "1"},
+    )
+
+
+def _timeout_error(e: Exception) -> HTTPException:
+    """504 response for an inference that did not finish in time"""
+    return HTTPException(
+        status_code=504,
+        detail=str(e)
+    )
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current authenticated user from JWT token"""
     token = credentials.credentials
@@ -168,7 +341,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = get_user_by_id(payload["user_id"])
+    if AUTH_TRUST_TOKEN_CLAIMS:
+        # The signed token already carries id, email and name
+        return user_from_claims(payload)
+    
+    try:
+        user = await async_get_user_by_id(payload["user_id"])
+    except AuthDatabaseError as e:
+        raise _overloaded_error(e)
+    
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -179,17 +360,32 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return user
 
 
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured admin token"""
+    # Any visitor can sign up, so a user token alone does not grant admin access
+    if not ADMIN_TOKEN or x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required"
+        )
+
+
 @app.post("/api/signup", response_model=TokenResponse)
 async def signup(user_data: SignupRequest):
     """
     User registration endpoint
     Creates a new user account and returns JWT token
     """
-    success, message = create_user(
-        email=user_data.email,
-        password=user_data.password,
-        name=user_data.name
-    )
+    try:
+        success, message = await async_create_user(
+            email=user_data.email,
+            password=user_data.password,
+            name=user_data.name
+        )
+    except (AuthBusy, AuthDatabaseError) as e:
+        raise _overloaded_error(e)
     
     if not success:
         raise HTTPException(
@@ -198,7 +394,10 @@ async def signup(user_data: SignupRequest):
         )
     
     # Authenticate the newly created user
-    auth_success, user = authenticate_user(user_data.email, user_data.password)
+    try:
+        auth_success, user = await async_authenticate_user(user_data.email, user_data.password)
+    except (AuthBusy, AuthDatabaseError) as e:
+        raise _overloaded_error(e)
     
     if not auth_success or user is None:
         raise HTTPException(
@@ -223,7 +422,10 @@ async def login(credentials: LoginRequest):
     User login endpoint
     Authenticates user and returns JWT token
     """
-    auth_success, user = authenticate_user(credentials.email, credentials.password)
+    try:
+        auth_success, user = await async_authenticate_user(credentials.email, credentials.password)
+    except (AuthBusy, AuthDatabaseError) as e:
+        raise _overloaded_error(e)
     
     if not auth_success or user is None:
         raise HTTPException(
@@ -253,6 +455,12 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     }
 
 
+@app.get("/api/auth/cache-stats", dependencies=[Depends(require_admin)])
+async def get_auth_cache_stats():
+    """Hit/miss counters of the authentication caches"""
+    return auth_cache_stats()
+
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(sensor_data: SensorData):
     """
@@ -260,84 +468,135 @@ async def predict(sensor_data: SensorData):
     
     Accepts sensor readings and returns predicted dravya with confidence score
     """
-    if model is None or preprocessor is None:
+    # One read of the bundle, so a concurrent reload cannot mix models
+    bundle = model_bundle
+    if bundle is None:
         raise HTTPException(
             status_code=503,
             detail="Model not loaded. Please train the model first."
         )
     
     try:
-        # Prepare input data
-        input_dict = {
-            'ph': sensor_data.ph,
-            'conductivity': sensor_data.conductivity,
-            'temperature': sensor_data.temperature,
-            'voltammetry': sensor_data.voltammetry
-        }
+        pred_proba = await micro_batcher.predict_proba(bundle.predictor, sensor_data.model_dump())
         
-        # Extract features
-        features = extract_features(input_dict)
-        
-        # Transform using preprocessor
-        features_scaled = preprocessor.transform(features)
-        
-        # Make prediction
-        # Check if it's a CNN model (TensorFlow/Keras)
-        if hasattr(model, 'predict'):
-            # Try Keras/TensorFlow model first
-            try:
-                import tensorflow as tf
-                if isinstance(model, tf.keras.Model):
-                    # For CNN, need voltammetry signal directly
-                    volt_signal = np.array(sensor_data.voltammetry)
-                    volt_signal = (volt_signal - volt_signal.mean()) / (volt_signal.std() + 1e-8)
-                    volt_signal = volt_signal.reshape(1, len(volt_signal), 1)
-                    pred_proba = model.predict(volt_signal, verbose=0)
-                    pred_class_idx = np.argmax(pred_proba[0])
-                    confidence = float(pred_proba[0][pred_class_idx])
-                    all_probas = pred_proba[0]
-                else:
-                    raise AttributeError("Not a Keras model")
-            except (ImportError, AttributeError, TypeError):
-                # Scikit-learn model
-                pred_proba = model.predict_proba(features_scaled)[0]
-                pred_class_idx = model.predict(features_scaled)[0]
-                confidence = float(pred_proba[pred_class_idx])
-                all_probas = pred_proba
-        else:
-            # Fallback for other model types
-            pred_class_idx = model.predict(features_scaled)[0]
-            pred_proba = model.predict_proba(features_scaled)[0]
-            confidence = float(pred_proba[pred_class_idx])
-            all_probas = pred_proba
-        
-        # Get class name
-        class_names = preprocessor.get_class_names()
-        predicted_dravya = class_names[pred_class_idx]
-        
-        # Create probability dictionary
-        all_probabilities = {
-            class_names[i]: float(all_probas[i]) 
-            for i in range(len(class_names))
-        }
+        with stage_timer('build_response'):
+            return _build_prediction(pred_proba, bundle.class_names, bundle.model_name)
+    
+    except InferenceQueueFull as e:
+        raise _overloaded_error(e)
+    
+    except InferenceTimeout as e:
+        raise _timeout_error(e)
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Error during prediction: {str(e)}"
+        )
+
+
+def _build_prediction(pred_proba: np.ndarray, class_names: List[str],
+                      model_name: str) -> PredictionResponse:
+    """Build a prediction response from one row of class probabilities"""
+    pred_class_idx = int(np.argmax(pred_proba))
+    
+    # Create probability dictionary
+    all_probabilities = dict(zip(class_names, map(float, pred_proba)))
+    
+    return PredictionResponse(
+        predicted_dravya=class_names[pred_class_idx],
+        confidence=float(pred_proba[pred_class_idx]),
+        all_probabilities=all_probabilities,
+        model_name=model_name
+    )
+
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(batch: BatchSensorData):
+    """
+    Predict dravya for a batch of sensor readings
+    
+    Accepts many readings at once and returns one prediction per reading,
+    in the same order as the input
+    """
+    # One read of the bundle, so a concurrent reload cannot mix models
+    bundle = model_bundle
+    if bundle is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not loaded. Please train the model first."
+        )
+    
+    try:
+        pred_proba = await inference_executor.predict_proba(
+            bundle.predictor, [reading.model_dump() for reading in batch.readings]
+        )
         
-        # Get model name from metadata
-        model_name = model_metadata.get('model_name', 'unknown') if model_metadata else 'unknown'
+        with stage_timer('build_response'):
+            predictions = [
+                _build_prediction(row, bundle.class_names, bundle.model_name)
+                for row in pred_proba
+            ]
         
-        return PredictionResponse(
-            predicted_dravya=predicted_dravya,
-            confidence=confidence,
-            all_probabilities=all_probabilities,
-            model_name=model_name
-        )
+        return BatchPredictionResponse(predictions=predictions, model_name=bundle.model_name)
+    
+    except InferenceQueueFull as e:
+        raise _overloaded_error(e)
+    
+    except InferenceTimeout as e:
+        raise _timeout_error(e)
     
     except Exception as e:
         raise HTTPException(
             status_code=400,
-            detail=f"Error during prediction: {str(e)}"
+            detail=f"Error during batch prediction: {str(e)}"
         )
 
 
+class ReloadResponse(BaseModel):
+    """Response model for a model reload"""
+    status: str
+    model_name: str
+    previous_model_name: Optional[str] = None
+    loaded_at: float
+
+
+@app.post("/api/admin/reload-model", response_model=ReloadResponse)
+async def reload_model_endpoint(_admin: None = Depends(require_admin)):
+    """
+    Load newly trained artifacts and swap them in without a restart
+    
+    Requests keep being served by the current model while the new one loads
+    """
+    previous = model_bundle
+    
+    try:
+        bundle = await reload_model()
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reloading model: {str(e)}"
+        )
+    
+    return ReloadResponse(
+        status="reloaded",
+        model_name=bundle.model_name,
+        previous_model_name=previous.model_name if previous is not None else None,
+        loaded_at=bundle.loaded_at
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, stage and model-load metrics in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -347,11 +606,17 @@ async def root():
         "endpoints": {
             "health": "/health",
             "predict": "/predict",
+            "predict_batch": "/predict/batch",
+            "reload_model": "/api/admin/reload-model",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
 
 
+startup_timings['import'] = time.perf_counter() - _import_started
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,25 +1,234 @@
 """
 Authentication utilities for E-Tongue API
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
 import sqlite3
+import threading
+import time
 import bcrypt
 import jwt
 import os
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Any, Hashable, Optional, Tuple
+
+try:
+    from .metrics import stage_timer, timed_stage
+except ImportError:
+    from metrics import stage_timer, timed_stage
 
 # JWT secret key (in production, use environment variable)
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "e-tongue-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# bcrypt cost factor (each +1 doubles hashing time)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Password hashing runs on a dedicated bounded pool so logins never block the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "64"))
+AUTH_DB_WORKERS = int(os.getenv("AUTH_DB_WORKERS", "4"))
+
+# Cache of verified tokens, so repeat requests skip signature verification
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+# Cache of user records for authenticated requests
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# Build the current user from the token claims without any database lookup
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
 # Database file
 DB_FILE = "users.db"
 
+# How long a connection waits for a lock held by another writer
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Retries of a statement that still fails with "database is locked"
+SQLITE_LOCK_RETRIES = 3
+
+_hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="auth-hash")
+_db_executor = ThreadPoolExecutor(max_workers=AUTH_DB_WORKERS, thread_name_prefix="auth-db")
+_hash_lock = threading.Lock()
+_hash_pending = 0
+
+
+class AuthBusy(Exception):
+    """Raised when too many password hashes are already pending"""
+
+
+class AuthDatabaseError(Exception):
+    """Raised when the user database cannot be queried"""
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live"""
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a live entry and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used one if full"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """Size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# User records by id. The API only ever inserts user rows and ids are never
+# reused, so entries cannot go stale through it; rows edited or deleted in the
+# database directly are served from the cache for up to USER_CACHE_TTL_SECONDS.
+_user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+
+# Verified token payloads by SHA-256 digest of the token; each entry expires at the token's exp
+_token_cache = TTLCache(TOKEN_CACHE_SIZE, ttl=JWT_EXPIRATION_HOURS * 3600)
+
+
+def clear_token_cache():
+    """Drop all verified tokens, e.g. after rotating JWT_SECRET_KEY"""
+    _token_cache.clear()
+
+
+def clear_user_cache():
+    """Drop all cached users"""
+    _user_cache.clear()
+
+
+def auth_cache_stats() -> dict:
+    """Hit/miss counters of the authentication caches"""
+    return {
+        "trust_token_claims": AUTH_TRUST_TOKEN_CLAIMS,
+        "user_cache": _user_cache.stats(),
+        "token_cache": _token_cache.stats(),
+    }
+
+
+# Persistent connections, one per (thread, database file)
+_thread_local = threading.local()
+_connections_lock = threading.Lock()
+_connections = []
+# Bumped by close_connections; threads holding connections of an older
+# generation open new ones
+_generation = 0
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Get the calling thread's persistent connection to DB_FILE
+    
+    Connections stay open for the lifetime of the thread, so repeated queries
+    reuse the connection and its prepared statement cache instead of paying
+    for connect/close on every call.
+    """
+    conns = getattr(_thread_local, 'connections', None)
+    if conns is None or _thread_local.generation != _generation:
+        conns = _thread_local.connections = {}
+        _thread_local.generation = _generation
+    
+    conn = conns.get(DB_FILE)
+    if conn is None:
+        conn = sqlite3.connect(
+            DB_FILE,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=128,
+            # Only the owning thread queries it; close_connections may close it from another
+            check_same_thread=False,
+        )
+        # WAL lets readers proceed while a signup is writing
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conns[DB_FILE] = conn
+        with _connections_lock:
+            _connections.append(conn)
+    
+    return conn
+
+
+def close_connections():
+    """Close all pooled connections (on shutdown)"""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        # Every thread, not only this one, opens a new connection on next use
+        _generation += 1
+
+
+def _with_retry(func):
+    """
+    Retry a database call that fails because another writer holds the lock
+    
+    The call, including retries, is timed as the stage 'sqlite_<name>'.
+    """
+    stage = 'sqlite_' + func.__name__.lstrip('_')
+    
+    @functools.wraps(func)
+    @timed_stage(stage)
+    def wrapper(*args, **kwargs):
+        for attempt in range(SQLITE_LOCK_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                if attempt == SQLITE_LOCK_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+    return wrapper
+
 
 def init_db():
     """Initialize SQLite database for users"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -34,21 +243,75 @@ def init_db():
     """)
     
     conn.commit()
-    conn.close()
 
 
+@timed_stage('bcrypt_hash')
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
+@timed_stage('bcrypt_verify')
 def verify_password(password: str, password_hash: str) -> bool:
     """Verify a password against a hash"""
     return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
 
+@_with_retry
+def _user_exists(email: str) -> bool:
+    """Check whether a user with this email exists"""
+    cursor = get_connection().execute("SELECT id FROM users WHERE email = ?", (email,))
+    return cursor.fetchone() is not None
+
+
+@_with_retry
+def _insert_user(email: str, password_hash: str, name: Optional[str] = None):
+    """Insert a user row"""
+    conn = get_connection()
+    # Commits on success, rolls back on error
+    with conn:
+        conn.execute(
+            "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
+            (email, password_hash, name or email.split('@')[0])
+        )
+
+
+@_with_retry
+def _get_user_credentials(email: str) -> Optional[tuple]:
+    """Get (id, email, password_hash, name) for a user, or None"""
+    cursor = get_connection().execute(
+        "SELECT id, email, password_hash, name FROM users WHERE email = ?", (email,)
+    )
+    return cursor.fetchone()
+
+
+@_with_retry
+def _get_user_row(user_id: int) -> Optional[tuple]:
+    """Get (id, email, name) for a user, or None"""
+    cursor = get_connection().execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+def _check_credentials(user: Optional[tuple], password: str) -> Tuple[bool, Optional[dict]]:
+    """Verify a password against a credentials row"""
+    if not user:
+        return False, None
+    
+    user_id, user_email, password_hash, user_name = user
+    
+    # Verify password
+    if not verify_password(password, password_hash):
+        return False, None
+    
+    return True, {
+        "id": user_id,
+        "email": user_email,
+        "name": user_name
+    }
+
+
 def create_user(email: str, password: str, name: Optional[str] = None) -> Tuple[bool, str]:
     """
     Create a new user
@@ -57,31 +320,19 @@ def create_user(email: str, password: str, name: Optional[str] = None) -> Tuple[
         (success: bool, message: str)
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
         # Check if user already exists
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        if cursor.fetchone():
-            conn.close()
+        if _user_exists(email):
             return False, "User with this email already exists"
         
-        # Hash password
-        password_hash = hash_password(password)
-        
-        # Insert user
-        cursor.execute(
-            "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
-            (email, password_hash, name or email.split('@')[0])
-        )
-        
-        conn.commit()
-        conn.close()
+        _insert_user(email, hash_password(password), name)
         
         return True, "User created successfully"
     
-    except Exception as e:
-        return False, f"Error creating user: {str(e)}"
+    except sqlite3.IntegrityError:
+        return False, "User with this email already exists"
+    
+    except sqlite3.Error as e:
+        raise AuthDatabaseError(f"User database unavailable: {e}") from e
 
 
 def authenticate_user(email: str, password: str) -> Tuple[bool, Optional[dict]]:
@@ -90,32 +341,106 @@ def authenticate_user(email: str, password: str) -> Tuple[bool, Optional[dict]]:
     
     Returns:
         (success: bool, user_data: dict or None)
+    
+    Raises:
+        AuthDatabaseError: If the user database cannot be queried
     """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Get user
-        cursor.execute("SELECT id, email, password_hash, name FROM users WHERE email = ?", (email,))
-        user = cursor.fetchone()
-        conn.close()
-        
-        if not user:
-            return False, None
-        
-        user_id, user_email, password_hash, user_name = user
+        user = _get_user_credentials(email)
+    except sqlite3.Error as e:
+        raise AuthDatabaseError(f"User database unavailable: {e}") from e
+    
+    try:
+        return _check_credentials(user, password)
+    except Exception:
+        # e.g. a malformed stored hash
+        return False, None
+
+
+async def _run_db(func, *args):
+    """Run a blocking database call on the DB thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, func, *args)
+
+
+async def _run_hash(func, *args):
+    """
+    Run a bcrypt call on the hashing pool
+    
+    Raises:
+        AuthBusy: If AUTH_MAX_PENDING hashes are already running or queued
+    """
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= AUTH_MAX_PENDING:
+            raise AuthBusy("Too many authentication requests. Please retry shortly.")
+        _hash_pending += 1
+    
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        with _hash_lock:
+            _hash_pending -= 1
+
+
+async def async_create_user(email: str, password: str,
+                            name: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Create a new user without blocking the event loop
+    
+    Returns:
+        (success: bool, message: str)
+    
+    Raises:
+        AuthBusy: If the hashing pool is saturated
+        AuthDatabaseError: If the user database cannot be queried
+    """
+    try:
+        if await _run_db(_user_exists, email):
+            return False, "User with this email already exists"
         
-        # Verify password
-        if not verify_password(password, password_hash):
-            return False, None
+        password_hash = await _run_hash(hash_password, password)
+        await _run_db(_insert_user, email, password_hash, name)
         
-        return True, {
-            "id": user_id,
-            "email": user_email,
-            "name": user_name
-        }
+        return True, "User created successfully"
     
-    except Exception as e:
+    except AuthBusy:
+        raise
+    
+    except sqlite3.IntegrityError:
+        # Another signup for the same email won the race
+        return False, "User with this email already exists"
+    
+    except sqlite3.Error as e:
+        raise AuthDatabaseError(f"User database unavailable: {e}") from e
+
+
+async def async_authenticate_user(email: str, password: str) -> Tuple[bool, Optional[dict]]:
+    """
+    Authenticate a user without blocking the event loop
+    
+    Returns:
+        (success: bool, user_data: dict or None)
+    
+    Raises:
+        AuthBusy: If the hashing pool is saturated
+        AuthDatabaseError: If the user database cannot be queried
+    """
+    try:
+        user = await _run_db(_get_user_credentials, email)
+    except sqlite3.Error as e:
+        raise AuthDatabaseError(f"User database unavailable: {e}") from e
+    
+    if not user:
+        return False, None
+    
+    try:
+        return await _run_hash(_check_credentials, user, password)
+    
+    except AuthBusy:
+        raise
+    
+    except Exception:
+        # e.g. a malformed stored hash
         return False, None
 
 
@@ -137,7 +462,8 @@ def generate_token(user_data: dict) -> str:
         "iat": datetime.utcnow()
     }
     
-    token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    with stage_timer('jwt_sign'):
+        token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
 
 
@@ -151,33 +477,69 @@ def verify_token(token: str) -> Optional[dict]:
     Returns:
         Decoded payload or None if invalid
     """
+    # Keyed by digest so the cache never holds the bearer tokens themselves
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        return dict(payload)
+    
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
+        with stage_timer('jwt_verify'):
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        if "exp" in payload:
+            _token_cache.set(digest, payload, ttl=payload["exp"] - time.time())
+        return dict(payload)
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
 
-def get_user_by_id(user_id: int) -> Optional[dict]:
-    """Get user by ID"""
+def _load_user(user_id: int) -> Optional[dict]:
+    """
+    Get user by ID from the database and cache it
+    
+    Raises:
+        AuthDatabaseError: If the user database cannot be queried
+    """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, email, name FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        
-        if not user:
-            return None
-        
-        return {
-            "id": user[0],
-            "email": user[1],
-            "name": user[2]
-        }
-    except Exception:
+        user = _get_user_row(user_id)
+    except sqlite3.Error as e:
+        raise AuthDatabaseError(f"User database unavailable: {e}") from e
+    
+    if not user:
         return None
+    
+    user_data = {
+        "id": user[0],
+        "email": user[1],
+        "name": user[2]
+    }
+    _user_cache.set(user_id, user_data)
+    return dict(user_data)
 
+
+def get_user_by_id(user_id: int) -> Optional[dict]:
+    """Get user by ID"""
+    user_data = _user_cache.get(user_id)
+    if user_data is not None:
+        return dict(user_data)
+    return _load_user(user_id)
+
+
+async def async_get_user_by_id(user_id: int) -> Optional[dict]:
+    """Get user by ID without blocking the event loop"""
+    # Cache hits are answered on the loop without a thread hop
+    user_data = _user_cache.get(user_id)
+    if user_data is not None:
+        return dict(user_data)
+    return await _run_db(_load_user, user_id)
+
+
+def user_from_claims(payload: dict) -> dict:
+    """Build the user record from verified token claims"""
+    return {
+        "id": payload["user_id"],
+        "email": payload["email"],
+        "name": payload.get("name", "")
+    }
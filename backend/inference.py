@@ -0,0 +1,367 @@
+"""
+Inference executor for E-Tongue API
+
+Feature extraction and model inference are CPU-bound, so running them inside
+an async handler blocks the event loop and stalls lightweight endpoints such
+as /health. The executor runs them on a bounded thread or process pool and
+rejects work once too many predictions are pending.
+
+Configuration (environment variables):
+    INFERENCE_EXECUTOR: 'thread' (default) or 'process'
+    INFERENCE_WORKERS: Number of workers (default: CPU count, at most 4)
+    INFERENCE_MAX_QUEUE: Maximum pending predictions, running or queued (default: 32)
+    INFERENCE_TIMEOUT_SECONDS: Per-request timeout (default: 10)
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    from .metrics import STAGE_DURATION
+    from .predictors import load_predictor
+except ImportError:
+    from metrics import STAGE_DURATION
+    from predictors import load_predictor
+
+
+EXECUTOR_KINDS = ('thread', 'process')
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the executor already holds the maximum number of pending predictions"""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a prediction does not finish within the timeout"""
+
+
+# Predictor owned by a process-pool worker, loaded once by _init_worker
+_worker_predictor = None
+
+
+def _init_worker(ml_dir: str):
+    """Load the model artifacts once per worker process"""
+    global _worker_predictor
+    _worker_predictor = load_predictor(ml_dir)
+
+
+def _predict_in_worker(readings: List[Dict]) -> np.ndarray:
+    """Run a prediction with the worker's own predictor"""
+    return _worker_predictor.predict_proba(readings)
+
+
+def _predict_each(predictor, readings: List[Dict]) -> List[Union[np.ndarray, Exception]]:
+    """Predict readings one at a time, returning each row or the exception it raised"""
+    results = []
+    for reading in readings:
+        try:
+            results.append(predictor.predict_proba([reading])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _predict_each_in_worker(readings: List[Dict]) -> List[Union[np.ndarray, Exception]]:
+    """_predict_each with the worker's own predictor"""
+    return _predict_each(_worker_predictor, readings)
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for predictions
+    
+    In thread mode the predictor passed to predict_proba runs on a worker
+    thread; NumPy and scikit-learn release the GIL for most of the work. In
+    process mode every worker loads its own copy of the artifacts from ml_dir,
+    and only the readings and the probability matrix cross process boundaries.
+    """
+    
+    def __init__(self, kind: str = 'thread', workers: Optional[int] = None,
+                 max_queue: int = 32, timeout: float = 10.0, ml_dir: Optional[str] = None):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind '{kind}', expected one of {EXECUTOR_KINDS}")
+        if kind == 'process' and ml_dir is None:
+            raise ValueError("Process executor needs ml_dir to load artifacts in workers")
+        
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.ml_dir = ml_dir
+        
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool: Optional[Executor] = None
+    
+    @classmethod
+    def from_env(cls, ml_dir: Optional[str] = None) -> 'InferenceExecutor':
+        """Create an executor configured from INFERENCE_* environment variables"""
+        workers = os.getenv('INFERENCE_WORKERS')
+        return cls(
+            kind=os.getenv('INFERENCE_EXECUTOR', 'thread').lower(),
+            workers=int(workers) if workers else None,
+            max_queue=int(os.getenv('INFERENCE_MAX_QUEUE', '32')),
+            timeout=float(os.getenv('INFERENCE_TIMEOUT_SECONDS', '10')),
+            ml_dir=ml_dir,
+        )
+    
+    @property
+    def pending(self) -> int:
+        """Predictions submitted and not yet finished"""
+        return self._pending
+    
+    def _get_pool(self) -> Executor:
+        """Create the worker pool on first use"""
+        if self._pool is None:
+            if self.kind == 'process':
+                # Spawned workers do not inherit the server's threads or event loop
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(os.path.abspath(self.ml_dir),),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='inference'
+                )
+        return self._pool
+    
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+    
+    async def predict_proba(self, predictor, readings: List[Dict]) -> np.ndarray:
+        """
+        Compute class probabilities on the worker pool
+        
+        Args:
+            predictor: Predictor bound to the loaded model (used in thread mode)
+            readings: Dictionaries with keys 'ph', 'conductivity', 'temperature', 'voltammetry'
+        
+        Returns:
+            Probability matrix (n_readings, n_classes)
+        
+        Raises:
+            InferenceQueueFull: If max_queue predictions are already pending
+            InferenceTimeout: If the prediction does not finish within the timeout
+        """
+        if self.kind == 'process':
+            return await self._run(_predict_in_worker, readings)
+        return await self._run(predictor.predict_proba, readings)
+    
+    async def predict_proba_each(self, predictor,
+                                 readings: List[Dict]) -> List[Union[np.ndarray, Exception]]:
+        """
+        Compute class probabilities reading by reading in one worker call
+        
+        Used to isolate the reading that made a batched call fail: every other
+        reading still gets its row.
+        
+        Returns:
+            Per reading, its probability vector or the exception it raised
+        
+        Raises:
+            InferenceQueueFull: If max_queue predictions are already pending
+            InferenceTimeout: If the predictions do not finish within the timeout
+        """
+        if self.kind == 'process':
+            return await self._run(_predict_each_in_worker, readings)
+        return await self._run(_predict_each, predictor, readings)
+    
+    async def _run(self, func, *args):
+        """Run func on the worker pool within the queue limit and timeout"""
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self.max_queue} pending). Please retry shortly."
+                )
+            self._pending += 1
+        
+        try:
+            future = self._get_pool().submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        
+        # A slot is freed only when the work actually finishes, so predictions
+        # that timed out still count against the queue while they run
+        future.add_done_callback(self._release)
+        
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise InferenceTimeout(f"Prediction did not finish within {self.timeout:g}s")
+    
+    def restart(self):
+        """Replace the worker pool, e.g. so process workers load new artifacts"""
+        old_pool, self._pool = self._pool, None
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-reading predictions into one model call
+    
+    Requests arriving within window_ms of the first one in a batch, up to
+    max_batch_size, are run as one matrix through the predictor on the
+    inference executor, and each caller receives its own row. Tree ensembles
+    and the CNN cost far less per row in a batch than in many 1-row calls.
+    
+    Configuration (environment variables):
+        PREDICT_BATCH_WINDOW_MS: Collection window (default: 2, 0 disables batching)
+        PREDICT_MAX_BATCH_SIZE: Maximum readings per batch (default: 64)
+    """
+    
+    def __init__(self, executor: InferenceExecutor, window_ms: float = 2.0,
+                 max_batch_size: int = 64):
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        # Bound waiting requests by what the executor could accept anyway
+        self.max_waiting = max_batch_size * executor.max_queue
+        
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._batches = set()
+    
+    @classmethod
+    def from_env(cls, executor: InferenceExecutor) -> 'MicroBatcher':
+        """Create a batcher configured from PREDICT_* environment variables"""
+        return cls(
+            executor,
+            window_ms=float(os.getenv('PREDICT_BATCH_WINDOW_MS', '2')),
+            max_batch_size=int(os.getenv('PREDICT_MAX_BATCH_SIZE', '64')),
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_batch_size > 1
+    
+    def _ensure_collector(self):
+        """Start the collector task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_waiting)
+            self._collector = loop.create_task(self._collect())
+    
+    async def predict_proba(self, predictor, reading: Dict) -> np.ndarray:
+        """
+        Compute class probabilities for one reading as part of a micro-batch
+        
+        Args:
+            predictor: Predictor bound to the loaded model
+            reading: Dictionary with keys 'ph', 'conductivity', 'temperature', 'voltammetry'
+        
+        Returns:
+            Probability vector (n_classes,)
+        
+        Raises:
+            InferenceQueueFull: If too many requests are already waiting
+            InferenceTimeout: If the batch does not finish within the executor timeout
+        """
+        if not self.enabled:
+            return (await self.executor.predict_proba(predictor, [reading]))[0]
+        
+        self._ensure_collector()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((predictor, reading, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise InferenceQueueFull(
+                f"Too many predictions waiting ({self.max_waiting}). Please retry shortly."
+            )
+        return await future
+    
+    async def _collect(self):
+        """Collect queued requests into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.window
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Dispatch without waiting, so the next batch is collected while
+            # this one runs on the executor
+            self._dispatch(batch)
+    
+    def _dispatch(self, batch: list):
+        # A model reload can swap the predictor mid-window; every group of
+        # requests runs on the predictor it was submitted with
+        groups = {}
+        dispatched = time.perf_counter()
+        for predictor, reading, future, queued in batch:
+            STAGE_DURATION.observe(dispatched - queued, 'batch_wait')
+            groups.setdefault(id(predictor), (predictor, []))[1].append((reading, future))
+        
+        for predictor, items in groups.values():
+            task = asyncio.ensure_future(self._run_batch(predictor, items))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+    
+    async def _run_batch(self, predictor, items: list):
+        """Run one batch and hand each caller its row"""
+        readings = [reading for reading, _ in items]
+        try:
+            rows = await self.executor.predict_proba(predictor, readings)
+        except (InferenceQueueFull, InferenceTimeout) as e:
+            self._fail(items, e)
+            return
+        except Exception as e:
+            if len(items) == 1:
+                self._fail(items, e)
+                return
+            # A reading the model rejects must not fail the requests batched
+            # with it: rerun the batch reading by reading
+            try:
+                rows = await self.executor.predict_proba_each(predictor, readings)
+            except Exception as e:
+                self._fail(items, e)
+                return
+        
+        for (_, future), row in zip(items, rows):
+            # Callers that disconnected have already cancelled their future
+            if future.done():
+                continue
+            if isinstance(row, Exception):
+                future.set_exception(row)
+            else:
+                future.set_result(row)
+    
+    @staticmethod
+    def _fail(items: list, error: Exception):
+        for _, future in items:
+            if not future.done():
+                future.set_exception(error)
+    
+    def shutdown(self):
+        """Stop collecting requests"""
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
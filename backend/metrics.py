@@ -0,0 +1,327 @@
+"""
+Request and stage metrics for E-Tongue API, exposed in Prometheus text format
+
+Recording a value costs a lock and a few additions; quantiles and the text
+exposition are only computed when /metrics is scraped.
+"""
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+import asyncio
+import bisect
+import contextvars
+import functools
+import threading
+import time
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Quantiles reported from the most recent observations of each series
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 1024
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], **extra) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric:
+    """Base class: a named family of series keyed by label values"""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def _header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+    
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+    
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+    
+    def dec(self, *labelvalues: str, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+    
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = float(value)
+    
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class CallbackGauge(_Metric):
+    """Gauge read from a function at scrape time"""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+    
+    def collect(self) -> List[str]:
+        return self._header() + [f'{self.name} {float(self.callback())}']
+
+
+class _HistogramSeries:
+    __slots__ = ('bucket_counts', 'total', 'count', 'recent')
+    
+    def __init__(self, n_buckets: int):
+        self.bucket_counts = [0] * (n_buckets + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+
+class Histogram(_Metric):
+    """
+    Latency distribution: cumulative buckets, sum and count, plus p50/p95/p99
+    over the most recent RESERVOIR_SIZE observations of each series
+    """
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+    
+    def observe(self, value: float, *labelvalues: str):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = _HistogramSeries(len(self.buckets))
+            series.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            series.total += value
+            series.count += 1
+            series.recent.append(value)
+    
+    @contextmanager
+    def time(self, *labelvalues: str):
+        """Observe the duration of a block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+    
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = {
+                key: (list(s.bucket_counts), s.total, s.count, sorted(s.recent))
+                for key, s in self._series.items()
+            }
+        
+        lines = self._header()
+        quantile_lines = []
+        for key, (bucket_counts, total, count, recent) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.labelnames, key, le=le)} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+            
+            for q in QUANTILES:
+                value = recent[min(len(recent) - 1, int(q * len(recent)))]
+                quantile_lines.append(
+                    f'{self.name}_quantile{_format_labels(self.labelnames, key, quantile=q)} {value}'
+                )
+        
+        if quantile_lines:
+            lines.append(
+                f'# HELP {self.name}_quantile {self.documentation} '
+                f'(quantiles of the last {RESERVOIR_SIZE} observations)'
+            )
+            lines.append(f'# TYPE {self.name}_quantile gauge')
+            lines.extend(quantile_lines)
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+REQUESTS = Counter(
+    'etongue_requests_total', 'HTTP requests by endpoint and status code',
+    ('method', 'endpoint', 'status')
+)
+REQUEST_ERRORS = Counter(
+    'etongue_request_errors_total', 'HTTP requests answered with a 4xx/5xx status',
+    ('endpoint', 'status')
+)
+REQUEST_DURATION = Histogram(
+    'etongue_request_duration_seconds', 'End-to-end request handling time', ('endpoint',)
+)
+REQUEST_PARSE_DURATION = Histogram(
+    'etongue_request_parse_seconds',
+    'Time from routing to the endpoint body: JSON parsing, Pydantic validation and dependencies',
+    ('endpoint',)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'etongue_requests_in_flight', 'Requests currently being handled', ('endpoint',)
+)
+STAGE_DURATION = Histogram(
+    'etongue_stage_duration_seconds',
+    'Time spent in one stage of prediction or authentication',
+    ('stage',)
+)
+MODEL_LOAD_DURATION = Gauge(
+    'etongue_model_load_seconds', 'Duration of the last model load by phase', ('phase',)
+)
+MODEL_LOADS = Counter(
+    'etongue_model_loads_total', 'Model loads and reloads by result', ('result',)
+)
+
+
+def stage_timer(stage: str):
+    """Context manager recording the duration of a prediction or authentication stage"""
+    return STAGE_DURATION.time(stage)
+
+
+def timed_stage(stage: str):
+    """Decorator recording the duration of every call as a stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_DURATION.time(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_model_load(timings: Dict[str, float], success: bool = True):
+    """Record the phase durations of a model load"""
+    for phase, seconds in timings.items():
+        MODEL_LOAD_DURATION.set(seconds, phase)
+    MODEL_LOADS.inc('success' if success else 'failure')
+
+
+def render_metrics() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# Start time of the request being handled in the current task
+_request_started = contextvars.ContextVar('request_started', default=None)
+
+
+def _mark_endpoint_start(endpoint: Callable, path: str) -> Callable:
+    """Wrap an async endpoint to record how long parsing and validation took"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        started = _request_started.get()
+        if started is not None:
+            REQUEST_PARSE_DURATION.observe(time.perf_counter() - started, path)
+        return await endpoint(*args, **kwargs)
+    return wrapper
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Route recording request counts, errors, in-flight requests and latency
+    
+    Set as the router's route_class before endpoints are declared.
+    """
+    
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = _mark_endpoint_start(endpoint, path)
+        super().__init__(path, endpoint, **kwargs)
+    
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        path = self.path
+        
+        async def instrumented_handler(request):
+            started = time.perf_counter()
+            token = _request_started.set(started)
+            REQUESTS_IN_FLIGHT.inc(path)
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                REQUESTS_IN_FLIGHT.dec(path)
+                REQUEST_DURATION.observe(time.perf_counter() - started, path)
+                REQUESTS.inc(request.method, path, str(status))
+                if status >= 400:
+                    REQUEST_ERRORS.inc(path, str(status))
+                _request_started.reset(token)
+        
+        return instrumented_handler
@@ -0,0 +1,407 @@
+"""
+Model-specific predictors for E-Tongue API
+
+The model type is resolved once when artifacts are loaded, and the matching
+predictor is bound for the lifetime of the model, so request handlers never
+probe the model type or import TensorFlow.
+"""
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import json
+import os
+import sys
+import time
+
+from ml.compiled_forest import COMPILED_FOREST_DIR, CompiledForest
+from ml.preprocess import DataPreprocessor
+from ml.utils import load_model, extract_features_batch
+
+try:
+    from .metrics import stage_timer
+except ImportError:
+    from metrics import stage_timer
+
+# Evaluate random forests with the compiled array engine instead of scikit-learn
+COMPILED_FOREST = os.getenv('COMPILED_FOREST', 'true').lower() in ('1', 'true', 'yes')
+
+# 'native' serves the pickled model, 'onnx' serves model.onnx with onnxruntime
+SERVING_BACKEND = os.getenv('SERVING_BACKEND', 'native').lower()
+# Threads one ONNX Runtime call may use (0 lets onnxruntime decide)
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', '1'))
+
+
+class SklearnPredictor:
+    """Predictor for scikit-learn classifiers trained on the 11 extracted features"""
+    
+    def __init__(self, model, preprocessor):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.class_names = preprocessor.get_class_names()
+    
+    def predict_proba(self, readings: List[Dict]) -> np.ndarray:
+        """
+        Compute class probabilities for a batch of readings with one model call
+        
+        Args:
+            readings: Dictionaries with keys 'ph', 'conductivity', 'temperature', 'voltammetry'
+        
+        Returns:
+            Probability matrix (n_readings, n_classes), rows in input order
+        """
+        with stage_timer('extract_features'):
+            features = extract_features_batch(readings)
+        with stage_timer('transform'):
+            features_scaled = self.preprocessor.transform(features)
+        with stage_timer('inference'):
+            return self.model.predict_proba(features_scaled)
+
+
+class ForestPredictor(SklearnPredictor):
+    """
+    Predictor for random forests, evaluated by a CompiledForest
+    
+    Gives the same probabilities as the forest's predict_proba without
+    scikit-learn's per-call validation and per-tree dispatch. Only the
+    compiled arrays are kept; the scikit-learn forest is not referenced.
+    """
+    
+    def __init__(self, model, preprocessor):
+        if not isinstance(model, CompiledForest):
+            model = CompiledForest.from_sklearn(model)
+        super().__init__(model, preprocessor)
+
+
+class KerasPredictor:
+    """Predictor for the 1D CNN, which takes the normalized voltammetry signal directly"""
+    
+    def __init__(self, model, preprocessor):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.class_names = preprocessor.get_class_names()
+    
+    def predict_proba(self, readings: List[Dict]) -> np.ndarray:
+        """
+        Compute class probabilities for a batch of readings
+        
+        Signals of equal length share one forward pass.
+        
+        Args:
+            readings: Dictionaries with keys 'ph', 'conductivity', 'temperature', 'voltammetry'
+        
+        Returns:
+            Probability matrix (n_readings, n_classes), rows in input order
+        """
+        with stage_timer('inference'):
+            return predict_signals(
+                readings, len(self.class_names),
+                lambda signals: self.model.predict(signals, verbose=0)
+            )
+
+
+def predict_signals(readings: List[Dict], n_classes: int, predict_fn) -> np.ndarray:
+    """
+    Run a signal model over a batch, one call per distinct signal length
+    
+    Args:
+        readings: Dictionaries with a 'voltammetry' signal
+        n_classes: Number of output classes
+        predict_fn: Maps normalized signals (n, length, 1) to probabilities (n, n_classes)
+    
+    Returns:
+        Probability matrix (n_readings, n_classes), rows in input order
+    """
+    lengths = np.array([len(r['voltammetry']) for r in readings])
+    pred_proba = np.zeros((len(readings), n_classes))
+    
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        volt_signals = np.array([readings[i]['voltammetry'] for i in rows], dtype=np.float64)
+        volt_signals = (
+            (volt_signals - volt_signals.mean(axis=1, keepdims=True))
+            / (volt_signals.std(axis=1, keepdims=True) + 1e-8)
+        )
+        pred_proba[rows] = predict_fn(volt_signals.reshape(len(rows), length, 1))
+    
+    return pred_proba
+
+
+class OnnxPredictor:
+    """
+    Predictor for an exported ONNX graph (see ml/export_onnx.py), run with onnxruntime
+    
+    scikit-learn graphs include the scaler and take the 11 raw features; the
+    CNN graph takes the normalized voltammetry signal.
+    """
+    
+    def __init__(self, session):
+        metadata = session.get_modelmeta().custom_metadata_map
+        self.session = session
+        self.class_names = json.loads(metadata['class_names'])
+        self.input_kind = metadata.get('input_kind', 'features')
+        self.input_name = session.get_inputs()[0].name
+        outputs = [output.name for output in session.get_outputs()]
+        self.output_name = 'probabilities' if 'probabilities' in outputs else outputs[-1]
+    
+    def _run(self, inputs: np.ndarray) -> np.ndarray:
+        return self.session.run(
+            [self.output_name], {self.input_name: inputs.astype(np.float32)}
+        )[0]
+    
+    def predict_proba(self, readings: List[Dict]) -> np.ndarray:
+        if self.input_kind == 'voltammetry':
+            with stage_timer('inference'):
+                return predict_signals(readings, len(self.class_names), self._run)
+        with stage_timer('extract_features'):
+            features = extract_features_batch(readings)
+        # The graph applies the scaler itself, so there is no separate transform stage
+        with stage_timer('inference'):
+            return self._run(features).astype(np.float64)
+
+
+def load_onnx_predictor(model_path: str) -> OnnxPredictor:
+    """Open an ONNX graph in an onnxruntime CPU session"""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"ONNX model not found at {model_path} (run ml/export_onnx.py)")
+    
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    # Concurrency comes from the inference workers, not from parallel graph branches
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+    return OnnxPredictor(session)
+
+
+def is_keras_model(model) -> bool:
+    """
+    Check whether a loaded model is a TensorFlow/Keras model
+    
+    Unpickling a Keras model imports TensorFlow, so if TensorFlow has not been
+    imported the model cannot be a Keras model and no import is attempted.
+    """
+    tf = sys.modules.get('tensorflow')
+    return tf is not None and isinstance(model, tf.keras.Model)
+
+
+def is_forest_model(model) -> bool:
+    """Check whether a loaded model is a single-output scikit-learn forest classifier"""
+    ensemble = sys.modules.get('sklearn.ensemble')
+    return (
+        ensemble is not None
+        and isinstance(model, (ensemble.RandomForestClassifier, ensemble.ExtraTreesClassifier))
+        and model.n_outputs_ == 1
+    )
+
+
+def make_predictor(model, preprocessor):
+    """Bind the predictor matching a loaded model"""
+    if isinstance(model, CompiledForest):
+        return ForestPredictor(model, preprocessor)
+    if is_keras_model(model):
+        return KerasPredictor(model, preprocessor)
+    if COMPILED_FOREST and is_forest_model(model):
+        return ForestPredictor(model, preprocessor)
+    return SklearnPredictor(model, preprocessor)
+
+
+ARTIFACT_FILES = (
+    'model.pkl', 'preprocessor.pkl', 'model_metadata.json',
+    'model.joblib', 'preprocessor.joblib', 'model.onnx', COMPILED_FOREST_DIR,
+)
+
+
+def _artifact_path(ml_dir: str, stem: str) -> str:
+    """
+    Path of an artifact, preferring the memory-mappable .joblib copy
+    
+    The .joblib file is only used if it is at least as new as the .pkl file,
+    so a model saved only as pickle is never shadowed by an older copy.
+    """
+    pkl_path = os.path.join(ml_dir, f'{stem}.pkl')
+    joblib_path = os.path.join(ml_dir, f'{stem}.joblib')
+    if os.path.exists(joblib_path) and (
+        not os.path.exists(pkl_path)
+        or os.path.getmtime(joblib_path) >= os.path.getmtime(pkl_path)
+    ):
+        return joblib_path
+    return pkl_path
+
+
+def load_artifacts(ml_dir: str) -> Tuple[object, DataPreprocessor, Optional[dict]]:
+    """
+    Load the trained model, preprocessor and metadata from the ML directory
+    
+    Arrays in .joblib artifacts are memory-mapped read-only, so API workers
+    and inference processes loading the same files share one copy in the OS
+    page cache.
+    
+    Returns:
+        (model, preprocessor, metadata); metadata is None if the file is missing
+    
+    Raises:
+        FileNotFoundError: If the model or preprocessor has not been trained yet
+    """
+    model_path = _artifact_path(ml_dir, 'model')
+    preprocessor_path = _artifact_path(ml_dir, 'preprocessor')
+    
+    if not os.path.exists(model_path) or not os.path.exists(preprocessor_path):
+        raise FileNotFoundError(f"Model files not found in {ml_dir}")
+    
+    model = load_model(model_path, mmap_mode='r')
+    return model, load_preprocessor(ml_dir), load_metadata(ml_dir)
+
+
+def load_preprocessor(ml_dir: str) -> DataPreprocessor:
+    """Load the fitted preprocessor, memory-mapping a .joblib copy"""
+    preprocessor_path = _artifact_path(ml_dir, 'preprocessor')
+    if not os.path.exists(preprocessor_path):
+        raise FileNotFoundError(f"Model files not found in {ml_dir}")
+    
+    preprocessor = DataPreprocessor()
+    preprocessor.load(preprocessor_path, mmap_mode='r')
+    return preprocessor
+
+
+def load_compiled_forest(ml_dir: str) -> Optional[CompiledForest]:
+    """
+    Memory-map the compiled forest saved at training time
+    
+    Returns None if there is none, or if it is older than the model file, so
+    a model replaced by hand is never served from stale arrays.
+    """
+    forest_dir = os.path.join(ml_dir, COMPILED_FOREST_DIR)
+    if not os.path.isdir(forest_dir):
+        return None
+    model_path = _artifact_path(ml_dir, 'model')
+    if os.path.exists(model_path) and os.path.getmtime(forest_dir) < os.path.getmtime(model_path):
+        return None
+    return CompiledForest.load(forest_dir, mmap_mode='r')
+
+
+def load_metadata(ml_dir: str) -> Optional[dict]:
+    """Load model_metadata.json, or None if it is missing"""
+    metadata_path = os.path.join(ml_dir, 'model_metadata.json')
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, 'r') as f:
+        return json.load(f)
+
+
+def load_predictor(ml_dir: str):
+    """Load artifacts from the ML directory and bind the predictor for SERVING_BACKEND"""
+    return load_bundle(ml_dir, warmup=False).predictor
+
+
+def artifact_mtimes(ml_dir: str) -> Tuple[float, ...]:
+    """Modification times of the artifact files (0 for missing files)"""
+    mtimes = []
+    for name in ARTIFACT_FILES:
+        try:
+            mtimes.append(os.path.getmtime(os.path.join(ml_dir, name)))
+        except OSError:
+            mtimes.append(0.0)
+    return tuple(mtimes)
+
+
+def artifacts_complete(mtimes: Tuple[float, ...]) -> bool:
+    """
+    Whether the files SERVING_BACKEND loads are all present and fully written
+    
+    train_model.py writes model_metadata.json after the model files, so for
+    the native backend a metadata file older than any of them means training
+    is still writing its outputs, and the model would be served with the
+    previous run's name and scores.
+    
+    Args:
+        mtimes: Result of artifact_mtimes (0 for missing files)
+    """
+    by_name = dict(zip(ARTIFACT_FILES, mtimes))
+    present = {name for name, mtime in by_name.items() if mtime}
+    if SERVING_BACKEND == 'onnx':
+        return 'model.onnx' in present
+    
+    model_files = {'model.pkl', 'model.joblib', COMPILED_FOREST_DIR}
+    preprocessor_files = {'preprocessor.pkl', 'preprocessor.joblib'}
+    if not (present & model_files and present & preprocessor_files):
+        return False
+    metadata_mtime = by_name['model_metadata.json']
+    return not metadata_mtime or metadata_mtime >= max(
+        by_name[name] for name in model_files | preprocessor_files
+    )
+
+
+class ModelBundle(NamedTuple):
+    """
+    Everything needed to serve one trained model
+    
+    The bundle is immutable and replaced as a whole on reload, so a request
+    that reads it once always uses a matching model, preprocessor and metadata.
+    """
+    model: object
+    # None when serving an ONNX graph, which includes the scaler
+    preprocessor: Optional[DataPreprocessor]
+    metadata: Optional[dict]
+    predictor: object
+    mtimes: Tuple[float, ...]
+    loaded_at: float
+    # Seconds spent loading artifacts ('artifact_load') and warming up ('warmup')
+    timings: Dict[str, float]
+    
+    @property
+    def model_name(self) -> str:
+        return self.metadata.get('model_name', 'unknown') if self.metadata else 'unknown'
+    
+    @property
+    def class_names(self) -> List[str]:
+        return self.predictor.class_names
+
+
+def warm_up(predictor, n_points: int = 100):
+    """Run one prediction so lazy initialization happens before real traffic"""
+    reading = {
+        'ph': 7.0,
+        'conductivity': 1.0,
+        'temperature': 25.0,
+        'voltammetry': np.sin(np.linspace(0, 4 * np.pi, n_points)).tolist(),
+    }
+    predictor.predict_proba([reading])
+
+
+def load_bundle(ml_dir: str, warmup: bool = True) -> ModelBundle:
+    """
+    Load artifacts into a ready-to-serve bundle
+    
+    Args:
+        ml_dir: Directory containing the trained artifacts
+        warmup: Run a prediction before returning the bundle
+    
+    Returns:
+        ModelBundle
+    """
+    # Taken before loading, so files rewritten during the load are picked up next time
+    mtimes = artifact_mtimes(ml_dir)
+    
+    started = time.perf_counter()
+    if SERVING_BACKEND == 'onnx':
+        predictor = load_onnx_predictor(os.path.join(ml_dir, 'model.onnx'))
+        model, preprocessor, metadata = predictor.session, None, load_metadata(ml_dir)
+    else:
+        compiled = load_compiled_forest(ml_dir) if COMPILED_FOREST else None
+        if compiled is not None:
+            # Saved arrays: the pickled forest is never loaded
+            model, preprocessor, metadata = compiled, load_preprocessor(ml_dir), load_metadata(ml_dir)
+        else:
+            model, preprocessor, metadata = load_artifacts(ml_dir)
+        predictor = make_predictor(model, preprocessor)
+        # A forest compiled here is served without its scikit-learn original
+        model = predictor.model
+    timings = {'artifact_load': time.perf_counter() - started}
+    
+    if warmup:
+        started = time.perf_counter()
+        warm_up(predictor)
+        timings['warmup'] = time.perf_counter() - started
+    
+    return ModelBundle(model, preprocessor, metadata, predictor, mtimes, time.time(), timings)
@@ -0,0 +1,519 @@
+"""
+Load-generation harness for the E-Tongue API
+
+Replays recorded traffic, or synthetic /predict payloads drawn from the
+DRAVYA_CLASSES sensor profiles, against a locally started API
+(uvicorn backend.app:app) or any running instance, and reports throughput,
+latency percentiles and error rates per operation.
+
+Two load models are supported:
+    closed loop (--concurrency N): N clients each send their next request as
+        soon as the previous one completes
+    open loop (--rate R): requests arrive at R per second whether or not
+        earlier ones have completed; latency is measured from the scheduled
+        arrival time, so queueing delay in the client is not hidden
+
+Usage:
+    python benchmarks/load_test.py --concurrency 16 --duration 30
+    python benchmarks/load_test.py --rate 200 --duration 60 --mix predict=0.8,me=0.15,login=0.05
+    python benchmarks/load_test.py --traffic recorded.jsonl --rate 50
+    python benchmarks/load_test.py --url http://localhost:8000 --slo-p99-ms 100 --max-error-rate 0.01
+
+Recorded traffic is JSONL, one request per line:
+    {"method": "POST", "path": "/predict", "body": {"ph": 6.8, ...}}
+A line holding a bare /predict payload is accepted too. --save-traffic writes
+the synthetic payloads in this format for later replay.
+"""
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from ml.generate_dataset import DRAVYA_CLASSES, generate_class_samples
+
+OPERATIONS = ('predict', 'me', 'login')
+PERCENTILES = (50, 90, 95, 99)
+
+SERVER_START_TIMEOUT_SECONDS = 120
+
+
+def synthetic_payloads(n_payloads: int, n_points: int = 100, seed: int = 42) -> List[Dict]:
+    """
+    /predict payloads spread evenly over the dravya classes
+    
+    Args:
+        n_payloads: Number of payloads
+        n_points: Points per voltammetry signal
+        seed: Random seed
+    
+    Returns:
+        List of request bodies, classes interleaved
+    """
+    n_per_class = -(-n_payloads // len(DRAVYA_CLASSES))
+    class_seeds = np.random.SeedSequence(seed).spawn(len(DRAVYA_CLASSES))
+    payloads = []
+    for (name, properties), class_seed in zip(DRAVYA_CLASSES.items(), class_seeds):
+        samples = generate_class_samples(name, properties, n_per_class, class_seed, n_points)
+        payloads.append([
+            {
+                'ph': float(samples['ph'][i]),
+                'conductivity': float(samples['conductivity'][i]),
+                'temperature': float(samples['temperature'][i]),
+                'voltammetry': samples['voltammetry'][i].tolist(),
+            }
+            for i in range(n_per_class)
+        ])
+    interleaved = [payload for group in zip(*payloads) for payload in group]
+    return interleaved[:n_payloads]
+
+
+def load_traffic(path: str) -> List[Tuple[str, str, Optional[Dict]]]:
+    """
+    Read recorded requests from a JSONL file
+    
+    Returns:
+        (method, path, body) tuples; lines in another format are skipped
+    """
+    requests = []
+    skipped = 0
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                skipped += 1
+                continue
+            if isinstance(record, dict) and 'path' in record:
+                requests.append((record.get('method', 'GET').upper(), record['path'], record.get('body')))
+            elif isinstance(record, dict) and 'voltammetry' in record:
+                requests.append(('POST', '/predict', record))
+            else:
+                skipped += 1
+    
+    if skipped:
+        print(f"Skipped {skipped} line(s) of {path} that are not recorded requests")
+    if not requests:
+        raise ValueError(f"No recorded requests found in {path}")
+    return requests
+
+
+def save_traffic(path: str, payloads: List[Dict]):
+    """Write /predict payloads as replayable JSONL"""
+    with open(path, 'w') as f:
+        for payload in payloads:
+            f.write(json.dumps({'method': 'POST', 'path': '/predict', 'body': payload}) + '\n')
+    print(f"Traffic saved to: {path}")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse 'predict=0.8,me=0.15,login=0.05' into normalized weights"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {OPERATIONS}")
+        weights[name] = float(weight) if weight else 1.0
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Workload mix weights must add up to more than 0")
+    return {name: weight / total for name, weight in weights.items() if weight > 0}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """
+    backend.app:app run by uvicorn in a subprocess
+    
+    The server runs in a temporary working directory, so its users.db is a
+    throwaway copy and the repository database is never touched.
+    """
+    
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self._work_dir = None
+        self._log = None
+        self._log_path = None
+        self._process = None
+    
+    def start(self):
+        self._work_dir = tempfile.TemporaryDirectory()
+        log_path = os.path.join(self._work_dir.name, 'server.log')
+        self._log_path = log_path
+        self._log = open(log_path, 'w')
+        command = [
+            sys.executable, '-m', 'uvicorn', 'backend.app:app',
+            '--app-dir', ROOT_DIR, '--host', '127.0.0.1', '--port', str(self.port),
+            '--workers', str(self.workers), '--log-level', 'warning',
+        ]
+        self._process = subprocess.Popen(
+            command, cwd=self._work_dir.name, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        print(f"Started API on {self.url} (log: {log_path})")
+    
+    def wait_ready(self, timeout: float = SERVER_START_TIMEOUT_SECONDS) -> Dict:
+        """
+        Wait until the API answers, and the model has loaded if it loads in the background
+        
+        Returns:
+            The /api/startup response
+        """
+        import httpx
+        
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(
+                    f"API exited with status {self._process.returncode}:\n{self._log_tail()}"
+                )
+            try:
+                startup = httpx.get(self.url + '/api/startup', timeout=2).json()
+                if startup['model_loaded'] or not startup['background_load']:
+                    return startup
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"API was not ready within {timeout:g}s")
+    
+    def _log_tail(self, n_lines: int = 20) -> str:
+        self._log.flush()
+        with open(self._log_path, 'r') as f:
+            return ''.join(f.readlines()[-n_lines:])
+    
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._log is not None:
+            self._log.close()
+        if self._work_dir is not None:
+            self._work_dir.cleanup()
+
+
+class Results:
+    """Latencies and outcomes per operation"""
+    
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.dropped = 0
+    
+    def add(self, operation: str, latency: float, status: str):
+        self.latencies.setdefault(operation, []).append(latency)
+        counts = self.statuses.setdefault(operation, {})
+        counts[status] = counts.get(status, 0) + 1
+    
+    def _summary(self, latencies: List[float], statuses: Dict[str, int], elapsed: float) -> Dict:
+        n_requests = len(latencies)
+        n_errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+        summary = {
+            'requests': n_requests,
+            'errors': n_errors,
+            'error_rate': n_errors / n_requests if n_requests else 0.0,
+            'throughput_rps': n_requests / elapsed if elapsed > 0 else 0.0,
+            'statuses': dict(sorted(statuses.items())),
+        }
+        if latencies:
+            values = np.percentile(np.array(latencies) * 1000, PERCENTILES)
+            summary.update({f'p{p}_ms': float(v) for p, v in zip(PERCENTILES, values)})
+            summary['mean_ms'] = float(np.mean(latencies) * 1000)
+            summary['max_ms'] = float(np.max(latencies) * 1000)
+        return summary
+    
+    def report(self, elapsed: float) -> Dict:
+        """Per-operation and overall summary"""
+        operations = {
+            operation: self._summary(latencies, self.statuses[operation], elapsed)
+            for operation, latencies in sorted(self.latencies.items())
+        }
+        all_statuses = {}
+        for counts in self.statuses.values():
+            for status, count in counts.items():
+                all_statuses[status] = all_statuses.get(status, 0) + count
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'elapsed_seconds': elapsed,
+            'dropped': self.dropped,
+            'total': self._summary(all_latencies, all_statuses, elapsed),
+            'operations': operations,
+        }
+
+
+def print_report(report: Dict):
+    print(f"\nElapsed: {report['elapsed_seconds']:.1f}s")
+    if report['dropped']:
+        print(f"Dropped (client at --max-outstanding): {report['dropped']}")
+    header = f"{'operation':<10} {'requests':>9} {'rps':>9} {'errors':>7} {'err %':>7}"
+    header += ''.join(f" {'p' + str(p):>9}" for p in PERCENTILES) + f" {'max':>9}"
+    print(header)
+    rows = list(report['operations'].items()) + [('total', report['total'])]
+    for name, summary in rows:
+        line = (f"{name:<10} {summary['requests']:>9} {summary['throughput_rps']:>9.1f} "
+                f"{summary['errors']:>7} {summary['error_rate'] * 100:>6.2f}%")
+        line += ''.join(f" {summary.get(f'p{p}_ms', 0.0):>9.2f}" for p in PERCENTILES)
+        line += f" {summary.get('max_ms', 0.0):>9.2f}"
+        print(line)
+    print("Latencies in ms. Status codes: " + ', '.join(
+        f"{status}={count}" for status, count in report['total']['statuses'].items()
+    ))
+
+
+class Workload:
+    """Picks the next request: recorded traffic in order, or a weighted mix of operations"""
+    
+    def __init__(self, mix: Dict[str, float], payloads: List[Dict],
+                 traffic: Optional[List[Tuple[str, str, Optional[Dict]]]] = None,
+                 n_users: int = 10, seed: int = 42):
+        self.mix = mix
+        self.payloads = payloads
+        self.traffic = traffic
+        self.users = [
+            {'email': f'loadtest{i}@example.com', 'password': f'loadtest-password-{i}'}
+            for i in range(n_users)
+        ]
+        self.tokens: List[str] = []
+        self._random = random.Random(seed)
+        self._count = 0
+    
+    async def setup(self, client):
+        """Create the test users and log them in once, for the 'me' operation"""
+        if self.traffic is not None or not ({'me', 'login'} & set(self.mix)):
+            return
+        for user in self.users:
+            # 400 means the user exists already, e.g. on a long-running server
+            response = await client.post('/api/signup', json={**user, 'name': 'load test'})
+            if response.status_code not in (200, 400):
+                raise RuntimeError(f"Signup failed with {response.status_code}: {response.text}")
+            response = await client.post('/api/login', json=user)
+            response.raise_for_status()
+            self.tokens.append(response.json()['token'])
+    
+    def next_request(self) -> Tuple[str, str, str, Dict]:
+        """(operation, method, path, request kwargs) of the next request"""
+        self._count += 1
+        if self.traffic is not None:
+            method, path, body = self.traffic[(self._count - 1) % len(self.traffic)]
+            operation = path.strip('/').split('/')[-1] or 'root'
+            return operation, method, path, ({'json': body} if body is not None else {})
+        
+        operation = self._random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if operation == 'predict':
+            return operation, 'POST', '/predict', {'json': self._random.choice(self.payloads)}
+        if operation == 'login':
+            return operation, 'POST', '/api/login', {'json': self._random.choice(self.users)}
+        headers = {'Authorization': f'Bearer {self._random.choice(self.tokens)}'}
+        return operation, 'GET', '/api/me', {'headers': headers}
+
+
+async def _send(client, workload: Workload, results: Results, started: float):
+    """Send one request; latency counts from `started`"""
+    operation, method, path, kwargs = workload.next_request()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = str(response.status_code)
+    except Exception as e:
+        status = type(e).__name__
+    results.add(operation, time.perf_counter() - started, status)
+
+
+async def run_closed_loop(client, workload: Workload, results: Results,
+                          concurrency: int, duration: float, max_requests: Optional[int]):
+    """`concurrency` clients, each sending back to back"""
+    deadline = time.perf_counter() + duration
+    sent = 0
+    
+    async def worker():
+        nonlocal sent
+        while time.perf_counter() < deadline and (max_requests is None or sent < max_requests):
+            sent += 1
+            await _send(client, workload, results, time.perf_counter())
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open_loop(client, workload: Workload, results: Results, rate: float,
+                        duration: float, max_requests: Optional[int], max_outstanding: int,
+                        arrival: str = 'poisson', seed: int = 42):
+    """Requests arriving at `rate` per second, independent of completions"""
+    rng = random.Random(seed)
+    outstanding = set()
+    start = time.perf_counter()
+    scheduled = start
+    sent = 0
+    
+    while scheduled - start < duration and (max_requests is None or sent < max_requests):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        if len(outstanding) >= max_outstanding:
+            results.dropped += 1
+        else:
+            task = asyncio.ensure_future(_send(client, workload, results, scheduled))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+            sent += 1
+        
+        scheduled += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+    
+    if outstanding:
+        await asyncio.gather(*outstanding)
+
+
+async def run_load(url: str, workload: Workload, args) -> Dict:
+    """Set up the workload and run it against the API at `url`"""
+    import httpx
+    
+    connections = args.concurrency if args.rate is None else args.max_outstanding
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        await workload.setup(client)
+        results = Results()
+        started = time.perf_counter()
+        if args.rate is None:
+            await run_closed_loop(client, workload, results, args.concurrency,
+                                  args.duration, args.requests)
+        else:
+            await run_open_loop(client, workload, results, args.rate, args.duration,
+                                args.requests, args.max_outstanding, args.arrival, args.seed)
+        return results.report(time.perf_counter() - started)
+
+
+def check_slo(report: Dict, p99_ms: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    """Violations of the latency and error-rate objectives"""
+    violations = []
+    total = report['total']
+    if p99_ms is not None and total.get('p99_ms', 0.0) > p99_ms:
+        violations.append(f"p99 {total['p99_ms']:.2f} ms > {p99_ms:g} ms")
+    if max_error_rate is not None and total['error_rate'] > max_error_rate:
+        violations.append(f"error rate {total['error_rate']:.4f} > {max_error_rate:g}")
+    return violations
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay or generate load against the E-Tongue API")
+    target = parser.add_argument_group('target')
+    target.add_argument('--url', help='Running API to test (default: start backend.app:app locally)')
+    target.add_argument('--server-workers', type=int, default=1,
+                        help='uvicorn worker processes for the local API')
+    
+    load = parser.add_argument_group('load')
+    load.add_argument('--concurrency', type=int, default=8,
+                      help='Closed-loop clients (ignored with --rate)')
+    load.add_argument('--rate', type=float,
+                      help='Open-loop arrival rate in requests per second')
+    load.add_argument('--arrival', choices=('poisson', 'uniform'), default='poisson',
+                      help='Open-loop inter-arrival distribution')
+    load.add_argument('--max-outstanding', type=int, default=256,
+                      help='Open-loop cap on requests in flight; arrivals beyond it are dropped')
+    load.add_argument('--duration', type=float, default=30.0, help='Seconds of load')
+    load.add_argument('--requests', type=int, help='Stop after this many requests')
+    load.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    
+    workload = parser.add_argument_group('workload')
+    workload.add_argument('--traffic', help='Replay recorded requests from a JSONL file')
+    workload.add_argument('--mix', default='predict=1',
+                          help="Operation weights, e.g. 'predict=0.8,me=0.15,login=0.05'")
+    workload.add_argument('--payloads', type=int, default=700,
+                          help='Distinct synthetic /predict payloads')
+    workload.add_argument('--n-points', type=int, default=100,
+                          help='Points per synthetic voltammetry signal')
+    workload.add_argument('--users', type=int, default=10, help='Test users for login/me')
+    workload.add_argument('--save-traffic', help='Write the synthetic payloads as JSONL and exit')
+    workload.add_argument('--seed', type=int, default=42)
+    
+    output = parser.add_argument_group('output')
+    output.add_argument('--output', help='Write the report as JSON')
+    output.add_argument('--slo-p99-ms', type=float, help='Fail if overall p99 latency exceeds this')
+    output.add_argument('--max-error-rate', type=float, help='Fail if the error rate exceeds this')
+    args = parser.parse_args(argv)
+    
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    
+    try:
+        traffic = load_traffic(args.traffic) if args.traffic else None
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    payloads = synthetic_payloads(args.payloads, args.n_points, args.seed) if 'predict' in mix else []
+    
+    if args.save_traffic:
+        save_traffic(args.save_traffic,
+                     payloads or synthetic_payloads(args.payloads, args.n_points, args.seed))
+        return 0
+    
+    work = Workload(mix, payloads, traffic, args.users, args.seed)
+    
+    server = None
+    url = args.url
+    if url is None:
+        server = LocalServer(workers=args.server_workers)
+        server.start()
+    try:
+        if server is not None:
+            startup = server.wait_ready()
+            if not startup['model_loaded']:
+                print("Warning: no trained model loaded, /predict will return 503 "
+                      "(run ml/train_model.py)")
+        
+        mode = (f"open loop at {args.rate:g} req/s ({args.arrival})" if args.rate is not None
+                else f"closed loop with {args.concurrency} clients")
+        source = f"traffic from {args.traffic}" if traffic is not None else f"mix {mix}"
+        print(f"Running {mode} for up to {args.duration:g}s: {source}")
+        
+        report = asyncio.run(run_load(url or server.url, work, args))
+    finally:
+        if server is not None:
+            server.stop()
+    
+    report['config'] = {
+        'url': args.url or 'local',
+        'mode': 'open' if args.rate is not None else 'closed',
+        'concurrency': args.concurrency if args.rate is None else None,
+        'rate': args.rate,
+        'arrival': args.arrival if args.rate is not None else None,
+        'duration': args.duration,
+        'traffic': args.traffic,
+        'mix': mix if traffic is None else None,
+    }
+    print_report(report)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to: {args.output}")
+    
+    violations = check_slo(report, args.slo_p99_ms, args.max_error_rate)
+    if violations:
+        print("SLO violated: " + '; '.join(violations))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,461 @@
+"""
+Benchmark suite for the E-Tongue feature, training and serving hot paths
+
+Measures feature extraction, dataset generation, per-model training time and
+end-to-end API latency (through an in-process ASGI client, no server needed)
+for several dataset sizes and signal lengths. Results are written to a JSON
+file and compared against a stored baseline; a benchmark whose median is
+slower than the baseline by more than its threshold is reported as a
+regression and the script exits with status 1.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --groups features,api --output results.json
+    python benchmarks/run_benchmarks.py --update-baseline
+
+Baselines are only comparable on the same machine and configuration; record
+a new one with --update-baseline after hardware or intentional changes. The
+results store a machine profile (CPU model and count, memory, relevant
+environment variables), and a baseline whose profile differs from the current
+one is compared for information only.
+"""
+import numpy as np
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ML_DIR = os.path.join(ROOT_DIR, 'ml')
+# train_model.py and its siblings use plain imports of each other
+sys.path.insert(0, ML_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from ml.generate_dataset import DRAVYA_CLASSES, generate_dataset, generate_voltammetry_signal
+from ml.preprocess import DataPreprocessor
+from ml.utils import extract_features, extract_features_batch
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+GROUPS = ('features', 'dataset', 'training', 'api')
+
+# Allowed slowdown of the median relative to the baseline, by group
+DEFAULT_THRESHOLDS = {
+    'default': 0.25,
+    'training': 0.5,
+    'api': 0.5,
+}
+# Differences below this are timer noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+
+# Environment variables that change the measured code paths
+PROFILE_ENV_VARS = (
+    'BCRYPT_ROUNDS', 'COMPILED_FOREST', 'SERVING_BACKEND', 'INFERENCE_EXECUTOR',
+    'INFERENCE_WORKERS', 'PREDICT_BATCH_WINDOW_MS',
+)
+
+SIGNAL_LENGTHS = (100, 1000, 10000)
+DATAFRAME_ROWS = (500, 2000)
+DATAFRAME_SIGNAL_LENGTHS = (100, 1000)
+DATASET_SAMPLES_PER_CLASS = (100, 500)
+DATASET_SIGNAL_LENGTHS = (100, 1000)
+TRAINING_SAMPLES_PER_CLASS = (50, 200)
+API_SIGNAL_LENGTHS = (100, 1000)
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics of durations in seconds, reported in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'repeat': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def measure(func: Callable, repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Time `repeat` calls of func after `warmup` untimed calls"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return _summarize(samples)
+
+
+async def measure_async(func: Callable, repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Time `repeat` awaited calls of an async function after `warmup` untimed calls"""
+    for _ in range(warmup):
+        await func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return _summarize(samples)
+
+
+@contextmanager
+def quiet():
+    """Silence the progress output of the code under test"""
+    with redirect_stdout(io.StringIO()):
+        yield
+
+
+def _record(results: Dict, group: str, name: str, params: Dict, stats: Dict):
+    key = name
+    if params:
+        key += '[' + ','.join(f'{k}={v}' for k, v in params.items()) + ']'
+    results[key] = {'group': group, 'params': params, **stats}
+    print(f"  {key:<60} median {stats['median_ms']:10.3f} ms   p95 {stats['p95_ms']:10.3f} ms")
+
+
+def _reading(n_points: int, rng: np.random.Generator) -> Dict:
+    return {
+        'ph': float(rng.uniform(3.5, 7.8)),
+        'conductivity': float(rng.uniform(0.7, 2.8)),
+        'temperature': float(rng.uniform(24, 32)),
+        'voltammetry': rng.normal(0.5, 0.2, n_points).tolist(),
+    }
+
+
+def _sensor_dataframe(n_rows: int, n_points: int, rng: np.random.Generator):
+    """DataFrame in the CSV layout, with voltammetry as comma-separated strings"""
+    import pandas as pd
+    
+    signals = rng.normal(0.5, 0.2, (n_rows, n_points))
+    return pd.DataFrame({
+        'ph': rng.uniform(3.5, 7.8, n_rows),
+        'conductivity': rng.uniform(0.7, 2.8, n_rows),
+        'temperature': rng.uniform(24, 32, n_rows),
+        'voltammetry': [','.join(map(str, signal)) for signal in signals.tolist()],
+    })
+
+
+def bench_features(results: Dict, repeat: int):
+    """ml.utils feature extraction and DataPreprocessor.extract_features_from_dataframe"""
+    rng = np.random.default_rng(42)
+    
+    for n_points in SIGNAL_LENGTHS:
+        reading = _reading(n_points, rng)
+        stats = measure(lambda: extract_features(reading), repeat * 20)
+        _record(results, 'features', 'extract_features', {'n_points': n_points}, stats)
+    
+    for n_points in SIGNAL_LENGTHS[:2]:
+        readings = [_reading(n_points, rng) for _ in range(64)]
+        stats = measure(lambda: extract_features_batch(readings), repeat * 5)
+        _record(results, 'features', 'extract_features_batch',
+                {'n_readings': 64, 'n_points': n_points}, stats)
+    
+    preprocessor = DataPreprocessor()
+    for n_rows in DATAFRAME_ROWS:
+        for n_points in DATAFRAME_SIGNAL_LENGTHS:
+            df = _sensor_dataframe(n_rows, n_points, rng)
+            stats = measure(lambda: preprocessor.extract_features_from_dataframe(df), repeat)
+            _record(results, 'features', 'extract_features_from_dataframe',
+                    {'n_rows': n_rows, 'n_points': n_points}, stats)
+
+
+def bench_dataset(results: Dict, repeat: int):
+    """Synthetic signal and dataset generation"""
+    properties = DRAVYA_CLASSES['Neem']
+    
+    for n_points in SIGNAL_LENGTHS:
+        stats = measure(
+            lambda: generate_voltammetry_signal(
+                properties['voltammetry_base'], properties['voltammetry_variance'], n_points
+            ),
+            repeat * 20
+        )
+        _record(results, 'dataset', 'generate_voltammetry_signal', {'n_points': n_points}, stats)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, 'dataset.csv')
+        for n_samples in DATASET_SAMPLES_PER_CLASS:
+            for n_points in DATASET_SIGNAL_LENGTHS:
+                def run():
+                    with quiet():
+                        generate_dataset(n_samples, output_path, n_jobs=1, n_points=n_points)
+                stats = measure(run, max(1, repeat // 2), warmup=0)
+                _record(results, 'dataset', 'generate_dataset',
+                        {'n_samples_per_class': n_samples, 'n_points': n_points}, stats)
+
+
+def bench_training(results: Dict, repeat: int):
+    """Per-model fit time of the train_model training functions, search included"""
+    from sklearn.model_selection import train_test_split
+    import train_model
+    
+    families = {
+        'random_forest': lambda X, y, X_val, y_val: train_model.train_random_forest(
+            X, y, X_val, y_val, search='halving', n_jobs=1
+        ),
+        'svm': lambda X, y, X_val, y_val: train_model.train_svm(
+            X, y, X_val, y_val, search='halving', n_jobs=1
+        ),
+    }
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_samples in TRAINING_SAMPLES_PER_CLASS:
+            with quiet():
+                df = generate_dataset(n_samples, os.path.join(tmp_dir, 'train.csv'), n_jobs=1)
+            preprocessor = DataPreprocessor()
+            X, y = preprocessor.fit_transform(
+                preprocessor.extract_features_from_dataframe(df), df['dravya'].to_numpy()
+            )
+            X_train, X_val, y_train, y_val = train_test_split(
+                X, y, test_size=0.2, random_state=42, stratify=y
+            )
+            
+            for family, fit in families.items():
+                def run():
+                    with quiet():
+                        fit(X_train, y_train, X_val, y_val)
+                stats = measure(run, max(1, repeat // 5), warmup=0)
+                _record(results, 'training', f'train_{family}',
+                        {'n_samples_per_class': n_samples}, stats)
+
+
+async def _bench_api(results: Dict, repeat: int):
+    import httpx
+    
+    app_module = importlib.import_module('backend.app')
+    auth_module = importlib.import_module('backend.auth')
+    app = app_module.app
+    rng = np.random.default_rng(42)
+    
+    with quiet():
+        await app.router.startup()
+        if app_module._background_load is not None:
+            await app_module._background_load
+    try:
+        
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            async def call(method: str, url: str, **kwargs):
+                response = await client.request(method, url, **kwargs)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text}")
+                return response
+            
+            if app_module.model_bundle is None:
+                print("  /predict skipped: no trained model in ml/ (run ml/train_model.py)")
+            else:
+                for n_points in API_SIGNAL_LENGTHS:
+                    payload = _reading(n_points, rng)
+                    stats = await measure_async(lambda: call('POST', '/predict', json=payload),
+                                                repeat * 10, warmup=5)
+                    _record(results, 'api', 'POST /predict', {'n_points': n_points}, stats)
+            
+            credentials = {'email': 'benchmark@example.com', 'password': 'benchmark-password'}
+            await call('POST', '/api/signup', json={**credentials, 'name': 'benchmark'})
+            
+            stats = await measure_async(lambda: call('POST', '/api/login', json=credentials),
+                                        repeat)
+            _record(results, 'api', 'POST /api/login',
+                    {'bcrypt_rounds': auth_module.BCRYPT_ROUNDS}, stats)
+            
+            token = (await call('POST', '/api/login', json=credentials)).json()['token']
+            headers = {'Authorization': f'Bearer {token}'}
+            stats = await measure_async(lambda: call('GET', '/api/me', headers=headers), repeat * 10)
+            _record(results, 'api', 'GET /api/me', {}, stats)
+    finally:
+        with quiet():
+            await app.router.shutdown()
+
+
+def bench_api(results: Dict, repeat: int):
+    """End-to-end latency of /predict, /api/login and /api/me through an in-process ASGI client"""
+    # The API keeps users.db in the working directory; use a throwaway one
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            asyncio.run(_bench_api(results, repeat))
+        finally:
+            os.chdir(cwd)
+
+
+BENCHMARKS = {
+    'features': bench_features,
+    'dataset': bench_dataset,
+    'training': bench_training,
+    'api': bench_api,
+}
+
+
+def _cpu_model() -> str:
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine_profile() -> Dict:
+    """Hardware and configuration the results depend on"""
+    try:
+        memory_gb = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024**3, 1)
+    except (AttributeError, ValueError, OSError):
+        memory_gb = None
+    usable_cpus = (
+        len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    )
+    return {
+        'cpu_model': _cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'usable_cpus': usable_cpus,
+        'memory_gb': memory_gb,
+        'env': {name: os.environ[name] for name in PROFILE_ENV_VARS if name in os.environ},
+    }
+
+
+def profile_differences(current: Dict, baseline: Optional[Dict]) -> List[str]:
+    """Profile fields that differ from the baseline's (all of them if it has none)"""
+    if not baseline:
+        return ['machine profile missing from baseline']
+    return [
+        f"{key}: baseline {baseline.get(key)!r}, current {current.get(key)!r}"
+        for key in ('cpu_model', 'cpu_count', 'usable_cpus', 'env')
+        if baseline.get(key) != current.get(key)
+    ]
+
+
+def run_benchmarks(groups: List[str], repeat: int) -> Dict:
+    """Run the selected benchmark groups and return the results document"""
+    import sklearn
+    
+    benchmarks = {}
+    for group in groups:
+        print(f"\n[{group}]")
+        BENCHMARKS[group](benchmarks, repeat)
+    
+    return {
+        'metadata': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'scikit-learn': sklearn.__version__,
+            'repeat': repeat,
+            'machine': machine_profile(),
+        },
+        'benchmarks': benchmarks,
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """
+    Compare results against a baseline and print a report
+    
+    Returns:
+        Names of benchmarks whose median regressed beyond their threshold
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get('thresholds', {})}
+    regressions = []
+    
+    print(f"\n{'benchmark':<60} {'baseline':>10} {'current':>10} {'ratio':>7}  status")
+    for key, current in results['benchmarks'].items():
+        reference = baseline['benchmarks'].get(key)
+        if reference is None:
+            print(f"{key:<60} {'-':>10} {current['median_ms']:10.3f} {'-':>7}  new")
+            continue
+        
+        ratio = current['median_ms'] / reference['median_ms']
+        threshold = thresholds.get(key, thresholds.get(current['group'], thresholds['default']))
+        delta = current['median_ms'] - reference['median_ms']
+        
+        if ratio > 1 + threshold and delta > MIN_DELTA_MS:
+            status = f"REGRESSION (> +{threshold:.0%})"
+            regressions.append(key)
+        elif ratio < 1 / (1 + threshold) and -delta > MIN_DELTA_MS:
+            status = "faster"
+        else:
+            status = "ok"
+        print(f"{key:<60} {reference['median_ms']:10.3f} {current['median_ms']:10.3f} "
+              f"{ratio:7.2f}  {status}")
+    
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the E-Tongue benchmark suite")
+    parser.add_argument('--groups', default=','.join(GROUPS),
+                        help=f"Comma-separated groups to run (default: {','.join(GROUPS)})")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Base number of timed runs; fast benchmarks run a multiple of it')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Results JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store these results as the new baseline instead of comparing')
+    args = parser.parse_args(argv)
+    
+    groups = [group.strip() for group in args.groups.split(',') if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))}")
+    
+    results = run_benchmarks(groups, args.repeat)
+    
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+    
+    if args.update_baseline:
+        previous = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                previous = json.load(f)
+        results['thresholds'] = previous.get('thresholds', DEFAULT_THRESHOLDS)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    
+    regressions = compare(results, baseline)
+    differences = profile_differences(
+        results['metadata']['machine'], baseline.get('metadata', {}).get('machine')
+    )
+    if differences:
+        # Timings from other hardware or settings say nothing about regressions
+        print("\nBaseline was recorded on a different machine or configuration:")
+        for difference in differences:
+            print(f"  {difference}")
+        print("Comparison is informational only; record a baseline here with --update-baseline")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed beyond their threshold")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Compiled array-based inference for random forest classifiers
+
+scikit-learn's predict_proba validates its input and dispatches one call per
+tree through joblib, which dominates the cost of predicting a few rows. A
+CompiledForest copies every tree of a fitted forest into flat node arrays once
+and evaluates all trees for a batch with vectorized NumPy traversal. Its
+probabilities are bit-for-bit identical to the forest's predict_proba.
+
+The arrays can be saved as .npy files and memory-mapped back, so serving a
+forest needs neither unpickling it nor a private copy of its nodes per process.
+"""
+import os
+import shutil
+
+import numpy as np
+
+
+# Directory next to model.pkl that train_model.py saves a compiled forest to
+COMPILED_FOREST_DIR = 'compiled_model'
+
+# Arrays written by CompiledForest.save, one .npy file each
+ARRAY_NAMES = (
+    'feature', 'threshold', 'children', 'missing_go_to_left', 'leaf_proba',
+    'roots', 'max_depth', 'classes',
+)
+
+# Rows evaluated together; bounds the (rows, trees) temporaries of apply()
+BLOCK_ROWS = 1024
+
+
+def _tree_values_are_counts() -> bool:
+    """
+    Whether fitted classification trees store weighted class counts
+    
+    scikit-learn < 1.4 stores counts and normalizes them in predict_proba;
+    later versions store the class fractions themselves.
+    """
+    import sklearn
+    major, minor = (int(part) for part in sklearn.__version__.split('.')[:2])
+    return (major, minor) < (1, 4)
+
+
+class CompiledForest:
+    """Flat-array copy of a fitted RandomForestClassifier / ExtraTreesClassifier"""
+    
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 missing_go_to_left: np.ndarray, leaf_proba: np.ndarray, roots: np.ndarray,
+                 max_depth: int, classes: np.ndarray):
+        self.feature = feature
+        self.threshold = threshold
+        # Left and right child of every node (n_nodes, 2); leaves point to themselves
+        self.children = children
+        self.missing_go_to_left = missing_go_to_left
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+    
+    @classmethod
+    def from_sklearn(cls, forest) -> 'CompiledForest':
+        """
+        Compile a fitted scikit-learn forest classifier
+        
+        Args:
+            forest: Fitted RandomForestClassifier or ExtraTreesClassifier
+        
+        Returns:
+            CompiledForest
+        """
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled")
+        
+        n_classes = forest.n_classes_
+        normalize = _tree_values_are_counts()
+        features, thresholds, children, missing, probas, roots = [], [], [], [], [], []
+        offset = 0
+        
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(offset, offset + n_nodes)
+            is_leaf = tree.children_left == -1
+            
+            # Leaves point to themselves, so every row can take the same
+            # number of steps regardless of the depth its leaf is at
+            children.append(np.stack([
+                np.where(is_leaf, node_ids, tree.children_left + offset),
+                np.where(is_leaf, node_ids, tree.children_right + offset),
+            ], axis=1))
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            if hasattr(tree, 'missing_go_to_left'):
+                missing.append(tree.missing_go_to_left.astype(bool))
+            else:
+                missing.append(np.zeros(n_nodes, dtype=bool))
+            
+            # Leaf values exactly as DecisionTreeClassifier.predict_proba returns them
+            proba = tree.value[:, 0, :n_classes]
+            if normalize:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            probas.append(np.ascontiguousarray(proba))
+            
+            roots.append(offset)
+            offset += n_nodes
+        
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children).astype(np.intp),
+            missing_go_to_left=np.concatenate(missing),
+            leaf_proba=np.concatenate(probas),
+            roots=np.array(roots, dtype=np.intp),
+            max_depth=max(estimator.tree_.max_depth for estimator in forest.estimators_),
+            classes=forest.classes_,
+        )
+    
+    def save(self, directory: str):
+        """
+        Save the arrays as .npy files in a directory
+        
+        The files are written next to the directory and swapped in afterwards,
+        so a reader never sees a half-written forest.
+        
+        Args:
+            directory: Output directory, replaced if it exists
+        """
+        staging = directory.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in ARRAY_NAMES:
+            value = self.classes_ if name == 'classes' else getattr(self, name)
+            np.save(os.path.join(staging, f'{name}.npy'), np.asarray(value), allow_pickle=False)
+        
+        previous = directory.rstrip(os.sep) + '.old'
+        if os.path.exists(directory):
+            shutil.rmtree(previous, ignore_errors=True)
+            os.rename(directory, previous)
+        os.rename(staging, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+    
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = 'r') -> 'CompiledForest':
+        """
+        Load a forest saved with save()
+        
+        Args:
+            directory: Directory written by save()
+            mmap_mode: Passed to np.load; the default 'r' maps the arrays
+                read-only, so processes loading the same files share them
+        
+        Returns:
+            CompiledForest
+        """
+        # Plain ndarray views of the mapping: indexing a np.memmap goes through
+        # its subclass hooks on every call, which made apply() about 2x slower
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode,
+                          allow_pickle=False).view(np.ndarray)
+            for name in ARRAY_NAMES
+        }
+        return cls(**arrays)
+    
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+    
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Find the leaf reached in every tree
+        
+        Args:
+            X: Feature matrix (n_samples, n_features)
+        
+        Returns:
+            Global leaf indices (n_samples, n_estimators)
+        """
+        # The forest compares float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_samples) * n_features)[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (n_samples, self.n_estimators))
+        check_missing = np.isnan(X).any()
+        # Left and right child of node i at 2 * i and 2 * i + 1, so one
+        # gather steps every row into the branch it takes
+        flat_children = self.children.ravel()
+        
+        for _ in range(self.max_depth):
+            values = np.take(flat_X, row_offsets + np.take(self.feature, nodes))
+            go_right = ~(values <= np.take(self.threshold, nodes))
+            if check_missing:
+                go_right = np.where(
+                    np.isnan(values), ~np.take(self.missing_go_to_left, nodes), go_right
+                )
+            nodes = np.take(flat_children, 2 * nodes + go_right)
+        
+        return nodes
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Compute class probabilities, identical to the forest's predict_proba
+        
+        Rows are evaluated in blocks of BLOCK_ROWS, so temporary memory stays
+        bounded by the block size, not by the number of rows.
+        
+        Args:
+            X: Feature matrix (n_samples, n_features)
+        
+        Returns:
+            Probability matrix (n_samples, n_classes)
+        """
+        X = np.asarray(X)
+        proba = np.empty((len(X), self.leaf_proba.shape[1]))
+        for start in range(0, len(X), BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            proba[start:stop] = self._predict_block(X[start:stop])
+        return proba
+    
+    def _predict_block(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.apply(X)
+        
+        # Accumulate tree by tree, in the forest's order, to reproduce its
+        # floating point sums exactly
+        proba = self.leaf_proba[leaves[:, 0]].copy()
+        for tree in range(1, self.n_estimators):
+            proba += self.leaf_proba[leaves[:, tree]]
+        proba /= self.n_estimators
+        return proba
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict class labels from the same probabilities"""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
@@ -0,0 +1,182 @@
+"""
+Export trained E-Tongue models to ONNX
+
+scikit-learn models are exported together with the preprocessor's scaler as
+one graph that maps the 11 raw features to class probabilities. The Keras CNN
+is exported on its own; it takes the per-row normalized voltammetry signal.
+The API can then serve any model family with onnxruntime alone.
+
+Requires skl2onnx (scikit-learn models) or tf2onnx (CNN).
+"""
+from typing import List
+import argparse
+import copy
+import json
+import os
+import sys
+
+try:
+    from .preprocess import DataPreprocessor, FEATURE_NAMES
+    from .utils import load_model
+except ImportError:
+    from preprocess import DataPreprocessor, FEATURE_NAMES
+    from utils import load_model
+
+
+# Graph input kinds recorded in the model's metadata
+INPUT_FEATURES = 'features'
+INPUT_VOLTAMMETRY = 'voltammetry'
+
+TARGET_OPSET = 15
+
+
+def _set_metadata(onnx_model, model_name: str, class_names: List[str], input_kind: str):
+    """Record what the API needs to serve the graph in its metadata properties"""
+    properties = {
+        'model_name': model_name,
+        'class_names': json.dumps(list(class_names)),
+        'input_kind': input_kind,
+    }
+    for key, value in properties.items():
+        entry = onnx_model.metadata_props.add()
+        entry.key = key
+        entry.value = value
+
+
+def _unwrap_frozen(model):
+    """
+    Replace FrozenEstimator wrappers in a calibrated classifier by the estimators they hold
+    
+    The calibrated SVM wraps its fitted SVC in a FrozenEstimator (scikit-learn
+    >= 1.6), which skl2onnx has no converter for. Predictions are unchanged.
+    """
+    try:
+        from sklearn.frozen import FrozenEstimator
+    except ImportError:
+        return model
+    
+    if not hasattr(model, 'calibrated_classifiers_'):
+        return model
+    
+    model = copy.deepcopy(model)
+    if isinstance(model.estimator, FrozenEstimator):
+        model.estimator = model.estimator.estimator
+    for calibrated in model.calibrated_classifiers_:
+        if isinstance(calibrated.estimator, FrozenEstimator):
+            calibrated.estimator = calibrated.estimator.estimator
+    return model
+
+
+def export_sklearn(model, preprocessor: DataPreprocessor, model_name: str):
+    """
+    Convert a scikit-learn classifier and the preprocessor's scaler into one ONNX graph
+    
+    Args:
+        model: Fitted scikit-learn classifier with predict_proba
+        preprocessor: Fitted DataPreprocessor
+        model_name: Name recorded in the graph metadata
+    
+    Returns:
+        ONNX ModelProto with input 'features' (n, 11) float32 and output
+        'probabilities' (n, n_classes)
+    """
+    from sklearn.pipeline import Pipeline
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    
+    if getattr(model, 'method', None) == 'isotonic':
+        print("Warning: skl2onnx approximates isotonic calibration; "
+              "ONNX probabilities may differ from the saved model")
+    
+    model = _unwrap_frozen(model)
+    pipeline = Pipeline([('scaler', preprocessor.scaler), ('model', model)])
+    n_features = len(preprocessor.feature_names or FEATURE_NAMES)
+    
+    onnx_model = convert_sklearn(
+        pipeline,
+        initial_types=[(INPUT_FEATURES, FloatTensorType([None, n_features]))],
+        # Plain probability matrix instead of a list of {class: probability} maps
+        options={id(model): {'zipmap': False}},
+        target_opset=TARGET_OPSET,
+    )
+    _set_metadata(onnx_model, model_name, preprocessor.get_class_names(), INPUT_FEATURES)
+    return onnx_model
+
+
+def export_keras(model, class_names: List[str], model_name: str = 'cnn'):
+    """
+    Convert the Keras CNN into an ONNX graph
+    
+    Args:
+        model: Fitted Keras model
+        class_names: Class names in output order
+        model_name: Name recorded in the graph metadata
+    
+    Returns:
+        ONNX ModelProto with input 'voltammetry' (n, length, 1) float32
+    """
+    import tensorflow as tf
+    import tf2onnx
+    
+    input_signature = [
+        tf.TensorSpec([None, None, 1], tf.float32, name=INPUT_VOLTAMMETRY)
+    ]
+    onnx_model, _ = tf2onnx.convert.from_keras(
+        model, input_signature=input_signature, opset=TARGET_OPSET
+    )
+    _set_metadata(onnx_model, model_name, class_names, INPUT_VOLTAMMETRY)
+    return onnx_model
+
+
+def is_keras_model(model) -> bool:
+    """Check whether a loaded model is a TensorFlow/Keras model"""
+    tf = sys.modules.get('tensorflow')
+    return tf is not None and isinstance(model, tf.keras.Model)
+
+
+def export_model(model_path: str = 'model.pkl', preprocessor_path: str = 'preprocessor.pkl',
+                 output_path: str = 'model.onnx', model_name: str = None):
+    """
+    Export saved training artifacts to an ONNX file
+    
+    Args:
+        model_path: Saved model
+        preprocessor_path: Saved preprocessor
+        output_path: Output .onnx file
+        model_name: Name recorded in the graph (default: from model_metadata.json)
+    """
+    model = load_model(model_path)
+    preprocessor = DataPreprocessor()
+    preprocessor.load(preprocessor_path)
+    
+    if model_name is None:
+        metadata_path = os.path.join(os.path.dirname(model_path) or '.', 'model_metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                model_name = json.load(f).get('model_name', 'unknown')
+        else:
+            model_name = 'unknown'
+    
+    if is_keras_model(model):
+        onnx_model = export_keras(model, preprocessor.get_class_names(), model_name)
+    else:
+        onnx_model = export_sklearn(model, preprocessor, model_name)
+    
+    # Write next to the target and rename, so a watching API never reads a partial file
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(onnx_model.SerializeToString())
+    os.replace(tmp_path, output_path)
+    
+    print(f"ONNX model saved as: {output_path}")
+    return onnx_model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the trained E-Tongue model to ONNX")
+    parser.add_argument('--model', default='model.pkl', help='Saved model')
+    parser.add_argument('--preprocessor', default='preprocessor.pkl', help='Saved preprocessor')
+    parser.add_argument('--output', default='model.onnx', help='Output ONNX file')
+    args = parser.parse_args()
+    
+    export_model(args.model, args.preprocessor, args.output)
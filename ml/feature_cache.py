@@ -0,0 +1,189 @@
+"""
+On-disk cache of extracted features for E-Tongue ML pipeline
+
+Parsing the voltammetry signals and computing the 11 features is the slowest
+part of loading a dataset. The cache stores the raw (unscaled) feature matrix,
+the labels and the parsed signal matrix, keyed by a content hash of the
+dataset and FEATURE_EXTRACTOR_VERSION, so repeated training runs skip both.
+"""
+import numpy as np
+from typing import Dict, List, Optional
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    from .preprocess import (
+        DataPreprocessor, load_dataset, FEATURE_EXTRACTOR_VERSION
+    )
+except ImportError:
+    from preprocess import (
+        DataPreprocessor, load_dataset, FEATURE_EXTRACTOR_VERSION
+    )
+
+
+CACHED_ARRAYS = ['features', 'labels', 'voltammetry', 'voltammetry_lengths']
+
+
+def hash_dataset(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute a content hash of a CSV file or binary dataset directory
+    
+    Args:
+        path: Path to CSV file or binary dataset directory
+        block_size: Bytes read at a time
+    
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    
+    if os.path.isdir(path):
+        files = sorted(f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))
+    else:
+        files = [os.path.basename(path)]
+        path = os.path.dirname(path)
+    
+    for name in files:
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(path, name), 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """Directory of cached feature sets with size-based LRU eviction"""
+    
+    def __init__(self, cache_dir: str = '.feature_cache', max_size_bytes: int = 2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+    
+    def key(self, dataset_path: str) -> str:
+        """Cache key for a dataset: content hash plus feature extractor version"""
+        return f"v{FEATURE_EXTRACTOR_VERSION}-{hash_dataset(dataset_path)[:32]}"
+    
+    def load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Load a cached entry (arrays are memory-mapped)
+        
+        Returns:
+            Dictionary of cached arrays, or None on a miss
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not all(os.path.exists(os.path.join(entry_dir, f'{name}.npy')) for name in CACHED_ARRAYS):
+            return None
+        
+        # Mark as recently used for eviction
+        os.utime(entry_dir, None)
+        
+        return {
+            name: np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r')
+            for name in CACHED_ARRAYS
+        }
+    
+    def save(self, key: str, arrays: Dict[str, np.ndarray]):
+        """Store an entry atomically, then evict old entries over the size limit"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # Write into a temporary directory and rename it into place, so readers
+        # never see a partially written entry
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            for name in CACHED_ARRAYS:
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), arrays[name])
+            entry_dir = os.path.join(self.cache_dir, key)
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.rename(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        self.evict(keep=key)
+    
+    def entries(self) -> List[str]:
+        """Cached entry keys, least recently used first"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        keys = [
+            k for k in os.listdir(self.cache_dir)
+            if not k.startswith('.') and os.path.isdir(os.path.join(self.cache_dir, k))
+        ]
+        return sorted(keys, key=lambda k: os.path.getmtime(os.path.join(self.cache_dir, k)))
+    
+    def entry_size(self, key: str) -> int:
+        """Size of a cached entry in bytes"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        return sum(
+            os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir)
+        )
+    
+    def evict(self, keep: Optional[str] = None):
+        """Delete least recently used entries until the cache fits max_size_bytes"""
+        keys = self.entries()
+        sizes = {k: self.entry_size(k) for k in keys}
+        total = sum(sizes.values())
+        
+        for k in keys:
+            if total <= self.max_size_bytes:
+                break
+            if k == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, k), ignore_errors=True)
+            total -= sizes[k]
+    
+    def invalidate(self, dataset_path: str):
+        """Drop the cached entry for a dataset"""
+        shutil.rmtree(os.path.join(self.cache_dir, self.key(dataset_path)), ignore_errors=True)
+    
+    def clear(self):
+        """Drop all cached entries"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def extract_dataset_features(dataset_path: str) -> Dict[str, np.ndarray]:
+    """
+    Load a dataset and extract its raw (unscaled) features
+    
+    Returns:
+        Dictionary with 'features', 'labels', 'voltammetry' and 'voltammetry_lengths'
+    """
+    dataset = load_dataset(dataset_path)
+    return {
+        'features': DataPreprocessor().extract_features_from_arrays(dataset),
+        'labels': np.asarray(dataset['dravya']).astype(str),
+        'voltammetry': dataset['voltammetry'],
+        'voltammetry_lengths': dataset['voltammetry_lengths'],
+    }
+
+
+def load_features(dataset_path: str,
+                  cache: Optional[FeatureCache] = None) -> Dict[str, np.ndarray]:
+    """
+    Load the feature matrix, labels and signal matrix of a dataset, using the cache if given
+    
+    Args:
+        dataset_path: Path to CSV file or binary dataset directory
+        cache: Feature cache (None disables caching)
+    
+    Returns:
+        Dictionary with 'features', 'labels', 'voltammetry' and 'voltammetry_lengths'
+    """
+    if cache is None:
+        return extract_dataset_features(dataset_path)
+    
+    started = time.perf_counter()
+    key = cache.key(dataset_path)
+    cached = cache.load(key)
+    if cached is not None:
+        print(f"Feature cache hit ({key}, {time.perf_counter() - started:.2f}s)")
+        return cached
+    
+    print(f"Feature cache miss ({key}), extracting features...")
+    arrays = extract_dataset_features(dataset_path)
+    cache.save(key, arrays)
+    return arrays
@@ -6,8 +6,17 @@ It generates realistic sensor data with appropriate noise and variation patterns
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
-import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import argparse
+import math
+import os
+import tempfile
+
+try:
+    from .preprocess import save_binary_dataset, create_binary_dataset
+except ImportError:
+    from preprocess import save_binary_dataset, create_binary_dataset
 
 
 # Ayurvedic Dravya (herbs) with their characteristic properties
@@ -64,38 +73,73 @@ DRAVYA_CLASSES = {
 }
 
 
-def generate_voltammetry_signal(base_value: float, variance: float, 
-                                  n_points: int = 100) -> List[float]:
+def generate_voltammetry_signals(base_value: float, variance: float, n_samples: int,
+                                 n_points: int = 100, rng=None) -> np.ndarray:
     """
-    Generate synthetic voltammetry signal (time-series electrochemical data)
+    Generate a batch of synthetic voltammetry signals (time-series electrochemical data)
     
-    Simulates cyclic voltammetry or linear sweep voltammetry response
+    Simulates cyclic voltammetry or linear sweep voltammetry response. The whole
+    batch is built with array operations, one row per sample.
+    
+    Args:
+        base_value: Peak amplitude of the signal
+        variance: Noise level
+        n_samples: Number of signals to generate
+        n_points: Number of points per signal
+        rng: numpy.random.Generator (defaults to the global np.random state)
+    
+    Returns:
+        Signal matrix (n_samples, n_points)
     """
-    # Generate time points
+    if rng is None:
+        rng = np.random
+    
+    # Generate time points, normalized to the scan length
     time = np.linspace(0, 10, n_points)
+    t = time / time[-1]
     
     # Create realistic voltammetry signal pattern
     # Peak response with exponential decay and noise
-    signal = []
-    peak_position = random.uniform(0.3, 0.7)  # Peak at 30-70% of scan
+    peak_position = rng.uniform(0.3, 0.7, size=(n_samples, 1))  # Peak at 30-70% of scan
     
-    for t in time:
-        # Gaussian-like peak with some drift
-        value = base_value * np.exp(-((t/time[-1] - peak_position) ** 2) / (2 * 0.1**2))
-        
-        # Add some harmonic components (simulating redox processes)
-        value += 0.1 * base_value * np.sin(2 * np.pi * t / time[-1])
-        value += 0.05 * base_value * np.cos(4 * np.pi * t / time[-1])
-        
-        # Add noise
-        value += np.random.normal(0, variance * 0.3)
-        
-        # Ensure positive values
-        value = max(0, value)
-        
-        signal.append(float(value))
+    # Gaussian-like peak with some drift
+    signals = base_value * np.exp(-((t - peak_position) ** 2) / (2 * 0.1**2))
+    
+    # Add some harmonic components (simulating redox processes)
+    signals += 0.1 * base_value * np.sin(2 * np.pi * t)
+    signals += 0.05 * base_value * np.cos(4 * np.pi * t)
+    
+    # Add noise
+    signals += rng.normal(0, variance * 0.3, size=(n_samples, n_points))
+    
+    # Ensure positive values
+    np.maximum(signals, 0, out=signals)
+    
+    return signals
+
+
+def generate_voltammetry_signal(base_value: float, variance: float, 
+                                  n_points: int = 100) -> List[float]:
+    """
+    Generate synthetic voltammetry signal (time-series electrochemical data)
+    
+    Simulates cyclic voltammetry or linear sweep voltammetry response
+    """
+    return generate_voltammetry_signals(base_value, variance, 1, n_points)[0].tolist()
+
+
+def generate_readings(value_range: Tuple[float, float], n_samples: int, rng=None) -> np.ndarray:
+    """
+    Generate sensor readings with Gaussian distribution around range midpoint
+    
+    About 99% of the draws fall inside the range; the rest are clipped to it.
+    """
+    if rng is None:
+        rng = np.random
     
-    return signal
+    mid = (value_range[0] + value_range[1]) / 2
+    std = (value_range[1] - value_range[0]) / 6  # ~99% within range
+    return np.clip(rng.normal(mid, std, size=n_samples), value_range[0], value_range[1])
 
 
 def generate_sample(dravya_name: str, properties: Dict) -> Dict:
@@ -104,92 +148,121 @@ def generate_sample(dravya_name: str, properties: Dict) -> Dict:
     
     Returns a dictionary with all sensor measurements
     """
-    # Generate pH reading with Gaussian distribution around range midpoint
-    ph_range = properties['ph_range']
-    ph_mid = (ph_range[0] + ph_range[1]) / 2
-    ph_std = (ph_range[1] - ph_range[0]) / 6  # ~99% within range
-    ph = np.random.normal(ph_mid, ph_std)
-    ph = np.clip(ph, ph_range[0], ph_range[1])
-    
-    # Generate conductivity reading
-    cond_range = properties['conductivity_range']
-    cond_mid = (cond_range[0] + cond_range[1]) / 2
-    cond_std = (cond_range[1] - cond_range[0]) / 6
-    conductivity = np.random.normal(cond_mid, cond_std)
-    conductivity = np.clip(conductivity, cond_range[0], cond_range[1])
-    
-    # Generate temperature reading
-    temp_range = properties['temperature_range']
-    temp_mid = (temp_range[0] + temp_range[1]) / 2
-    temp_std = (temp_range[1] - temp_range[0]) / 6
-    temperature = np.random.normal(temp_mid, temp_std)
-    temperature = np.clip(temperature, temp_range[0], temp_range[1])
-    
-    # Generate voltammetry signal
-    voltammetry = generate_voltammetry_signal(
-        properties['voltammetry_base'],
-        properties['voltammetry_variance'],
-        n_points=100
-    )
-    
     return {
         'dravya': dravya_name,
-        'ph': float(ph),
-        'conductivity': float(conductivity),
-        'temperature': float(temperature),
-        'voltammetry': voltammetry
+        'ph': float(generate_readings(properties['ph_range'], 1)[0]),
+        'conductivity': float(generate_readings(properties['conductivity_range'], 1)[0]),
+        'temperature': float(generate_readings(properties['temperature_range'], 1)[0]),
+        'voltammetry': generate_voltammetry_signal(
+            properties['voltammetry_base'],
+            properties['voltammetry_variance'],
+            n_points=100
+        )
     }
 
 
+def generate_class_samples(dravya_name: str, properties: Dict, n_samples: int,
+                           seed=None, n_points: int = 100) -> Dict[str, np.ndarray]:
+    """
+    Generate a batch of synthetic sensor readings for one dravya
+    
+    Args:
+        dravya_name: Class label
+        properties: Class properties from DRAVYA_CLASSES
+        n_samples: Number of samples to generate
+        seed: Seed or np.random.SeedSequence for an independent random stream
+        n_points: Number of points per voltammetry signal
+    
+    Returns:
+        Dictionary of column arrays ('dravya', 'ph', 'conductivity',
+        'temperature', 'voltammetry')
+    """
+    rng = np.random.default_rng(seed)
+    
+    return {
+        'dravya': np.full(n_samples, dravya_name),
+        'ph': generate_readings(properties['ph_range'], n_samples, rng),
+        'conductivity': generate_readings(properties['conductivity_range'], n_samples, rng),
+        'temperature': generate_readings(properties['temperature_range'], n_samples, rng),
+        'voltammetry': generate_voltammetry_signals(
+            properties['voltammetry_base'],
+            properties['voltammetry_variance'],
+            n_samples,
+            n_points=n_points,
+            rng=rng
+        )
+    }
+
+
+def _generate_class_samples_task(args: Tuple) -> Dict[str, np.ndarray]:
+    """Process pool entry point for generate_class_samples"""
+    return generate_class_samples(*args)
+
+
 def generate_dataset(n_samples_per_class: int = 215, 
                      output_path: str = 'synthetic_dataset.csv',
-                     seed: int = 42) -> pd.DataFrame:
+                     seed: int = 42,
+                     n_jobs: Optional[int] = None,
+                     n_points: int = 100) -> pd.DataFrame:
     """
     Generate complete synthetic dataset
     
+    Each class is generated as one batch from its own random stream, spawned
+    from `seed`, so the output is identical whatever the number of workers.
+    
     Args:
         n_samples_per_class: Number of samples to generate for each dravya class
-        output_path: Path to save the CSV file
+        output_path: Path to save the CSV file, or a binary dataset directory
+            if the path does not end in '.csv'
         seed: Random seed for reproducibility
+        n_jobs: Number of worker processes (None: one per class, up to the CPU count)
+        n_points: Number of points per voltammetry signal
     
     Returns:
-        DataFrame with all sensor data
+        DataFrame with all sensor data (the voltammetry column is only included
+        for CSV output)
     """
-    np.random.seed(seed)
-    random.seed(seed)
-    
     print("Generating synthetic E-Tongue dataset...")
     print(f"Classes: {list(DRAVYA_CLASSES.keys())}")
     print(f"Samples per class: {n_samples_per_class}")
     
-    all_samples = []
-    
-    for dravya_name, properties in DRAVYA_CLASSES.items():
-        print(f"Generating samples for {dravya_name}...")
-        for _ in range(n_samples_per_class):
-            sample = generate_sample(dravya_name, properties)
-            all_samples.append(sample)
-    
-    # Convert to DataFrame
-    # For CSV storage, we'll flatten voltammetry as a list stored as string
-    df_data = []
-    for sample in all_samples:
-        row = {
-            'dravya': sample['dravya'],
-            'ph': sample['ph'],
-            'conductivity': sample['conductivity'],
-            'temperature': sample['temperature'],
-            'voltammetry': ','.join(map(str, sample['voltammetry']))  # Store as comma-separated string
-        }
-        df_data.append(row)
-    
-    df = pd.DataFrame(df_data)
+    class_seeds = np.random.SeedSequence(seed).spawn(len(DRAVYA_CLASSES))
+    tasks = [
+        (dravya_name, properties, n_samples_per_class, class_seed, n_points)
+        for (dravya_name, properties), class_seed in zip(DRAVYA_CLASSES.items(), class_seeds)
+    ]
+    
+    if n_jobs is None:
+        n_jobs = min(len(tasks), os.cpu_count() or 1)
+    
+    if n_jobs > 1:
+        print(f"Generating classes in {n_jobs} worker processes...")
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            class_samples = list(executor.map(_generate_class_samples_task, tasks))
+    else:
+        class_samples = []
+        for task in tasks:
+            print(f"Generating samples for {task[0]}...")
+            class_samples.append(_generate_class_samples_task(task))
     
     # Shuffle the dataset
-    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    order = np.random.default_rng(seed).permutation(n_samples_per_class * len(tasks))
+    dataset = {
+        name: np.concatenate([samples[name] for samples in class_samples])[order]
+        for name in ('dravya', 'ph', 'conductivity', 'temperature', 'voltammetry')
+    }
+    del class_samples
     
-    # Save to CSV
-    df.to_csv(output_path, index=False)
+    df = pd.DataFrame({
+        name: dataset[name] for name in ('dravya', 'ph', 'conductivity', 'temperature')
+    })
+    
+    if output_path.endswith('.csv'):
+        # For CSV storage, voltammetry is stored as a comma-separated string
+        df['voltammetry'] = [','.join(map(str, signal)) for signal in dataset['voltammetry'].tolist()]
+        df.to_csv(output_path, index=False)
+    else:
+        save_binary_dataset(output_path, dataset)
     
     print(f"\nDataset generated successfully!")
     print(f"Total samples: {len(df)}")
@@ -202,11 +275,191 @@ def generate_dataset(n_samples_per_class: int = 215,
     return df
 
 
-if __name__ == "__main__":
-    # Generate dataset with ~215 samples per class (total ~1505 samples)
-    df = generate_dataset(
-        n_samples_per_class=215,
-        output_path='synthetic_dataset.csv',
-        seed=42
+def _record_dtype(n_points: int) -> np.dtype:
+    """Fixed-size on-disk record used for shuffle buckets in streaming mode"""
+    return np.dtype([
+        ('label', np.int16),
+        ('ph', np.float64),
+        ('conductivity', np.float64),
+        ('temperature', np.float64),
+        ('voltammetry', np.float64, (n_points,))
+    ])
+
+
+def generate_dataset_streaming(n_samples_per_class: int = 215,
+                               output_path: str = 'synthetic_dataset.csv',
+                               seed: int = 42,
+                               chunk_size: int = 100_000,
+                               n_points: int = 100,
+                               tmp_dir: Optional[str] = None) -> int:
+    """
+    Generate a synthetic dataset in chunks without holding it all in memory
+    
+    Samples are generated `chunk_size` rows at a time and scattered into
+    bucket files on disk, each row to a uniformly random bucket. Every bucket
+    (about `chunk_size` rows) is then shuffled in memory and appended to the
+    output, which yields a uniform shuffle of the whole dataset. Peak memory
+    is a few chunks, independent of the dataset size.
+    
+    Args:
+        n_samples_per_class: Number of samples to generate for each dravya class
+        output_path: Path to save the CSV file, or a binary dataset directory
+            if the path does not end in '.csv'
+        seed: Random seed for reproducibility
+        chunk_size: Number of rows generated and written at a time
+        n_points: Number of points per voltammetry signal
+        tmp_dir: Directory for the bucket files (defaults to the output directory)
+    
+    Returns:
+        Total number of samples written
+    """
+    class_names = list(DRAVYA_CLASSES.keys())
+    n_total = n_samples_per_class * len(class_names)
+    n_buckets = max(1, math.ceil(n_total / chunk_size))
+    record_dtype = _record_dtype(n_points)
+    
+    print("Generating synthetic E-Tongue dataset (streaming)...")
+    print(f"Classes: {class_names}")
+    print(f"Samples per class: {n_samples_per_class}")
+    print(f"Chunk size: {chunk_size} ({n_buckets} shuffle buckets)")
+    
+    class_seeds = np.random.SeedSequence(seed).spawn(len(class_names) + 1)
+    shuffle_rng = np.random.default_rng(class_seeds[-1])
+    
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(output_path))
+    
+    with tempfile.TemporaryDirectory(prefix='etongue_buckets_', dir=tmp_dir) as bucket_dir:
+        bucket_paths = [os.path.join(bucket_dir, f'bucket_{i:06d}.bin') for i in range(n_buckets)]
+        
+        # Pass 1: generate chunks and scatter rows into random buckets
+        for label, (dravya_name, properties) in enumerate(DRAVYA_CLASSES.items()):
+            print(f"Generating samples for {dravya_name}...")
+            class_rng = np.random.default_rng(class_seeds[label])
+            
+            for start in range(0, n_samples_per_class, chunk_size):
+                n_chunk = min(chunk_size, n_samples_per_class - start)
+                samples = generate_class_samples(
+                    dravya_name, properties, n_chunk, seed=class_rng, n_points=n_points
+                )
+                
+                records = np.empty(n_chunk, dtype=record_dtype)
+                records['label'] = label
+                for name in ('ph', 'conductivity', 'temperature', 'voltammetry'):
+                    records[name] = samples[name]
+                del samples
+                
+                buckets = shuffle_rng.integers(n_buckets, size=n_chunk)
+                order = np.argsort(buckets, kind='stable')
+                bounds = np.searchsorted(buckets[order], np.arange(n_buckets + 1))
+                for bucket in np.flatnonzero(np.diff(bounds)):
+                    with open(bucket_paths[bucket], 'ab') as f:
+                        f.write(records[order[bounds[bucket]:bounds[bucket + 1]]].tobytes())
+                del records
+        
+        # Pass 2: shuffle each bucket and append it to the output
+        if output_path.endswith('.csv'):
+            write_chunk, close = _csv_chunk_writer(output_path, class_names)
+        else:
+            write_chunk, close = _binary_chunk_writer(output_path, class_names, n_total, n_points)
+        
+        class_counts = np.zeros(len(class_names), dtype=np.int64)
+        for bucket_path in bucket_paths:
+            if not os.path.exists(bucket_path):
+                continue
+            records = np.fromfile(bucket_path, dtype=record_dtype)
+            os.remove(bucket_path)
+            records = records[shuffle_rng.permutation(len(records))]
+            class_counts += np.bincount(records['label'], minlength=len(class_names))
+            write_chunk(records)
+            del records
+        close()
+    
+    print(f"\nDataset generated successfully!")
+    print(f"Total samples: {n_total}")
+    print(f"Saved to: {output_path}")
+    print(f"\nDataset statistics:")
+    for dravya_name, count in zip(class_names, class_counts):
+        print(f"{dravya_name}: {count}")
+    
+    return n_total
+
+
+def _csv_chunk_writer(output_path: str, class_names: List[str]):
+    """Writer appending shuffled record chunks to a CSV file"""
+    labels = np.array(class_names)
+    f = open(output_path, 'w', newline='')
+    f.write('dravya,ph,conductivity,temperature,voltammetry\n')
+    
+    def write_chunk(records: np.ndarray):
+        pd.DataFrame({
+            'dravya': labels[records['label']],
+            'ph': records['ph'],
+            'conductivity': records['conductivity'],
+            'temperature': records['temperature'],
+            # For CSV storage, voltammetry is stored as a comma-separated string
+            'voltammetry': [','.join(map(str, signal)) for signal in records['voltammetry'].tolist()]
+        }).to_csv(f, index=False, header=False)
+    
+    return write_chunk, f.close
+
+
+def _binary_chunk_writer(output_path: str, class_names: List[str], n_total: int, n_points: int):
+    """Writer filling a preallocated binary dataset with shuffled record chunks"""
+    labels = np.array(class_names)
+    columns = create_binary_dataset(
+        output_path, n_total, n_points, label_width=max(len(name) for name in class_names)
     )
+    columns['voltammetry_lengths'][:] = n_points
+    position = 0
+    
+    def write_chunk(records: np.ndarray):
+        nonlocal position
+        rows = slice(position, position + len(records))
+        columns['dravya'][rows] = labels[records['label']]
+        for name in ('ph', 'conductivity', 'temperature', 'voltammetry'):
+            columns[name][rows] = records[name]
+        position += len(records)
+    
+    def close():
+        for column in columns.values():
+            column.flush()
+    
+    return write_chunk, close
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic E-Tongue sensor dataset"
+    )
+    parser.add_argument('--samples-per-class', type=int, default=215,
+                        help='Number of samples per dravya class')
+    parser.add_argument('--output', default='synthetic_dataset.csv',
+                        help='Output CSV file, or binary dataset directory if not ending in .csv')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Number of worker processes (default: one per class)')
+    parser.add_argument('--n-points', type=int, default=100,
+                        help='Number of points per voltammetry signal')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Stream the dataset to disk this many rows at a time '
+                             '(for datasets larger than memory)')
+    args = parser.parse_args()
+    
+    if args.chunk_size:
+        generate_dataset_streaming(
+            n_samples_per_class=args.samples_per_class,
+            output_path=args.output,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            n_points=args.n_points
+        )
+    else:
+        # Generate dataset with ~215 samples per class (total ~1505 samples)
+        df = generate_dataset(
+            n_samples_per_class=args.samples_per_class,
+            output_path=args.output,
+            seed=args.seed,
+            n_jobs=args.n_jobs,
+            n_points=args.n_points
+        )
@@ -2,22 +2,93 @@
 Preprocessing utilities for E-Tongue ML pipeline
 """
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from typing import Tuple
+from typing import TYPE_CHECKING, Dict, Iterator, Tuple
 import pickle
+import json
+import os
+
+# pandas, scikit-learn and joblib are imported where they are used, so the
+# API can import this module without loading them
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    from .utils import stack_signals, voltammetry_statistics
+except ImportError:
+    from utils import stack_signals, voltammetry_statistics
+
+
+# Number of rows parsed into one signal matrix at a time
+PARSE_CHUNK_SIZE = 100_000
+
+# Bump when the feature definitions change, to invalidate cached features
+FEATURE_EXTRACTOR_VERSION = 1
+
+FEATURE_NAMES = [
+    'ph', 'conductivity', 'temperature',
+    'volt_mean', 'volt_std', 'volt_max', 'volt_min',
+    'volt_median', 'volt_q1', 'volt_q3', 'volt_tv'
+]
+
+# Binary dataset layout: one .npy file per column inside a directory
+BINARY_DATASET_COLUMNS = ['dravya', 'ph', 'conductivity', 'temperature',
+                          'voltammetry', 'voltammetry_lengths']
+BINARY_DATASET_FORMAT_VERSION = 1
+
+
+def parse_voltammetry_column(voltammetry: 'pd.Series') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a column of voltammetry signals into one 2-D float array
+    
+    Signals are usually stored as comma-separated strings; the whole column is
+    joined and converted in a single call instead of row by row. Rows of
+    different lengths are right-padded with NaN.
+    
+    Args:
+        voltammetry: Series of comma-separated strings or lists of floats
+    
+    Returns:
+        Signal matrix (n_samples, max_length) and array of signal lengths
+    """
+    values = voltammetry.tolist()
+    
+    if not all(isinstance(v, str) for v in values):
+        # Mixed storage (lists, missing values): fall back to per-row parsing
+        signals = [
+            [float(x) for x in v.split(',')] if isinstance(v, str)
+            else (v if isinstance(v, list) else [])
+            for v in values
+        ]
+        return stack_signals(signals)
+    
+    n_samples = len(values)
+    lengths = np.array([v.count(',') + 1 for v in values], dtype=np.int64)
+    flat = np.array(','.join(values).split(','), dtype=np.float64)
+    
+    max_length = int(lengths.max()) if n_samples > 0 else 0
+    if np.all(lengths == max_length):
+        return flat.reshape(n_samples, max_length), lengths
+    
+    # Ragged signals: scatter the flat values into a NaN-padded matrix
+    rows = np.repeat(np.arange(n_samples), lengths)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix = np.full((n_samples, max_length), np.nan)
+    matrix[rows, np.arange(len(flat)) - offsets] = flat
+    return matrix, lengths
 
 
 class DataPreprocessor:
     """Handles data preprocessing for E-Tongue sensor data"""
     
     def __init__(self):
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+        
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
         self.feature_names = None
         self.is_fitted = False
     
-    def extract_features_from_dataframe(self, df: pd.DataFrame) -> np.ndarray:
+    def extract_features_from_dataframe(self, df: 'pd.DataFrame') -> np.ndarray:
         """
         Extract features from DataFrame with sensor readings
         
@@ -27,50 +98,60 @@ class DataPreprocessor:
         Returns:
             Feature matrix (n_samples, n_features)
         """
-        features_list = []
-        
-        for idx, row in df.iterrows():
-            # Parse voltammetry signal (stored as comma-separated string)
-            if isinstance(row['voltammetry'], str):
-                voltammetry = [float(x) for x in row['voltammetry'].split(',')]
-            else:
-                voltammetry = row['voltammetry'] if isinstance(row['voltammetry'], list) else []
-            
-            # Extract features
-            ph = row['ph']
-            conductivity = row['conductivity']
-            temperature = row['temperature']
-            
-            # Basic features
-            feature_vector = [ph, conductivity, temperature]
-            
-            # Voltammetry statistical features
-            if len(voltammetry) > 0:
-                volt_array = np.array(voltammetry)
-                feature_vector.extend([
-                    np.mean(volt_array),
-                    np.std(volt_array),
-                    np.max(volt_array),
-                    np.min(volt_array),
-                    np.median(volt_array),
-                    np.percentile(volt_array, 25),
-                    np.percentile(volt_array, 75),
-                    np.sum(np.abs(np.diff(volt_array))),
-                ])
-            else:
-                feature_vector.extend([0.0] * 8)
-            
-            features_list.append(feature_vector)
-        
-        features = np.array(features_list)
+        n_samples = len(df)
+        features = np.empty((n_samples, 11))
+        
+        # Basic features
+        features[:, :3] = df[['ph', 'conductivity', 'temperature']].to_numpy(dtype=np.float64)
+        
+        # Voltammetry statistical features, parsed and reduced a chunk at a time
+        # so the parsed signal matrix stays bounded for very large datasets
+        for start in range(0, n_samples, PARSE_CHUNK_SIZE):
+            stop = min(start + PARSE_CHUNK_SIZE, n_samples)
+            signals, lengths = parse_voltammetry_column(df['voltammetry'].iloc[start:stop])
+            features[start:stop, 3:] = voltammetry_statistics(signals, lengths)
         
         # Store feature names
         if self.feature_names is None:
-            self.feature_names = [
-                'ph', 'conductivity', 'temperature',
-                'volt_mean', 'volt_std', 'volt_max', 'volt_min',
-                'volt_median', 'volt_q1', 'volt_q3', 'volt_tv'
-            ]
+            self.feature_names = list(FEATURE_NAMES)
+        
+        return features
+    
+    def extract_features_from_arrays(self, dataset: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Extract features from a columnar dataset (see `load_dataset`)
+        
+        The signal matrix may be memory-mapped; it is read and reduced a chunk
+        of rows at a time.
+        
+        Args:
+            dataset: Dictionary with arrays 'ph', 'conductivity', 'temperature',
+                'voltammetry' and optionally 'voltammetry_lengths'
+        
+        Returns:
+            Feature matrix (n_samples, n_features)
+        """
+        n_samples = len(dataset['ph'])
+        features = np.empty((n_samples, 11))
+        
+        # Basic features
+        features[:, 0] = dataset['ph']
+        features[:, 1] = dataset['conductivity']
+        features[:, 2] = dataset['temperature']
+        
+        # Voltammetry statistical features
+        signals = dataset['voltammetry']
+        lengths = dataset.get('voltammetry_lengths')
+        for start in range(0, n_samples, PARSE_CHUNK_SIZE):
+            stop = min(start + PARSE_CHUNK_SIZE, n_samples)
+            features[start:stop, 3:] = voltammetry_statistics(
+                signals[start:stop],
+                None if lengths is None else lengths[start:stop]
+            )
+        
+        # Store feature names
+        if self.feature_names is None:
+            self.feature_names = list(FEATURE_NAMES)
         
         return features
     
@@ -97,6 +178,36 @@ class DataPreprocessor:
         
         return X_scaled, y_encoded
     
+    def partial_fit(self, X: np.ndarray, y: np.ndarray = None) -> 'DataPreprocessor':
+        """
+        Incrementally fit preprocessor on one chunk of data
+        
+        Updates the scaler statistics and the set of known class labels, so a
+        dataset can be fitted chunk by chunk without loading it whole.
+        
+        Args:
+            X: Feature matrix for this chunk
+            y: Target labels for this chunk (optional)
+        
+        Returns:
+            self
+        """
+        self.scaler.partial_fit(X)
+        
+        if y is not None:
+            chunk_classes = np.unique(y)
+            if hasattr(self.label_encoder, 'classes_'):
+                chunk_classes = np.union1d(self.label_encoder.classes_, chunk_classes)
+            self.label_encoder.classes_ = chunk_classes
+        
+        self.is_fitted = True
+        
+        return self
+    
+    def transform_labels(self, y: np.ndarray) -> np.ndarray:
+        """Encode class names using fitted label encoder"""
+        return self.label_encoder.transform(y)
+    
     def transform(self, X: np.ndarray) -> np.ndarray:
         """Transform features using fitted scaler"""
         if not self.is_fitted:
@@ -112,20 +223,28 @@ class DataPreprocessor:
         return list(self.label_encoder.classes_)
     
     def save(self, filepath: str):
-        """Save preprocessor to file"""
+        """Save preprocessor to pickle file, or to joblib format if the path ends in .joblib"""
         preprocessor_data = {
             'scaler': self.scaler,
             'label_encoder': self.label_encoder,
             'feature_names': self.feature_names,
             'is_fitted': self.is_fitted
         }
+        if filepath.endswith('.joblib'):
+            import joblib
+            joblib.dump(preprocessor_data, filepath)
+            return
         with open(filepath, 'wb') as f:
             pickle.dump(preprocessor_data, f)
     
-    def load(self, filepath: str):
-        """Load preprocessor from file"""
-        with open(filepath, 'rb') as f:
-            preprocessor_data = pickle.load(f)
+    def load(self, filepath: str, mmap_mode: str = None):
+        """Load preprocessor from pickle or joblib (.joblib) file"""
+        if filepath.endswith('.joblib'):
+            import joblib
+            preprocessor_data = joblib.load(filepath, mmap_mode=mmap_mode)
+        else:
+            with open(filepath, 'rb') as f:
+                preprocessor_data = pickle.load(f)
         
         self.scaler = preprocessor_data['scaler']
         self.label_encoder = preprocessor_data['label_encoder']
@@ -133,31 +252,256 @@ class DataPreprocessor:
         self.is_fitted = preprocessor_data['is_fitted']
 
 
+def is_binary_dataset(path: str) -> bool:
+    """Check whether a path points to a binary (columnar .npy) dataset"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'dataset.json'))
+
+
+def save_binary_dataset(output_dir: str, dataset: Dict[str, np.ndarray]):
+    """
+    Save a columnar dataset in the binary format
+    
+    Each column is written as its own .npy file so it can be memory-mapped on
+    load. Signals are stored as a fixed-width float32 matrix; rows shorter than
+    the widest signal are NaN-padded and their lengths kept in
+    'voltammetry_lengths'.
+    
+    Args:
+        output_dir: Dataset directory (created if missing)
+        dataset: Dictionary with 'dravya', 'ph', 'conductivity', 'temperature',
+            'voltammetry' and optionally 'voltammetry_lengths'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    signals = np.asarray(dataset['voltammetry'], dtype=np.float32)
+    lengths = dataset.get('voltammetry_lengths')
+    if lengths is None:
+        lengths = np.full(len(signals), signals.shape[1])
+    
+    columns = {
+        'dravya': np.asarray(dataset['dravya']).astype(str),
+        'ph': np.asarray(dataset['ph'], dtype=np.float64),
+        'conductivity': np.asarray(dataset['conductivity'], dtype=np.float64),
+        'temperature': np.asarray(dataset['temperature'], dtype=np.float64),
+        'voltammetry': signals,
+        'voltammetry_lengths': np.asarray(lengths, dtype=np.int32),
+    }
+    for name, values in columns.items():
+        np.save(os.path.join(output_dir, f'{name}.npy'), values)
+    
+    _write_binary_dataset_info(output_dir, len(signals), signals.shape[1])
+
+
+def create_binary_dataset(output_dir: str, n_samples: int, n_points: int,
+                          label_width: int) -> Dict[str, np.ndarray]:
+    """
+    Create an empty binary dataset to be filled in place
+    
+    Used to write datasets larger than memory: the returned columns are
+    writable memory maps, so rows can be assigned a slice at a time.
+    
+    Args:
+        output_dir: Dataset directory (created if missing)
+        n_samples: Number of rows
+        n_points: Width of the voltammetry matrix
+        label_width: Maximum length of a class label
+    
+    Returns:
+        Dictionary of writable column memory maps; call .flush() on each when done
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    column_specs = {
+        'dravya': (f'<U{label_width}', (n_samples,)),
+        'ph': (np.float64, (n_samples,)),
+        'conductivity': (np.float64, (n_samples,)),
+        'temperature': (np.float64, (n_samples,)),
+        'voltammetry': (np.float32, (n_samples, n_points)),
+        'voltammetry_lengths': (np.int32, (n_samples,)),
+    }
+    columns = {
+        name: np.lib.format.open_memmap(
+            os.path.join(output_dir, f'{name}.npy'), mode='w+', dtype=dtype, shape=shape
+        )
+        for name, (dtype, shape) in column_specs.items()
+    }
+    
+    _write_binary_dataset_info(output_dir, n_samples, n_points)
+    return columns
+
+
+def _write_binary_dataset_info(output_dir: str, n_samples: int, n_points: int):
+    """Write the dataset.json descriptor of a binary dataset"""
+    with open(os.path.join(output_dir, 'dataset.json'), 'w') as f:
+        json.dump({
+            'format_version': BINARY_DATASET_FORMAT_VERSION,
+            'n_samples': int(n_samples),
+            'n_points': int(n_points),
+            'columns': BINARY_DATASET_COLUMNS
+        }, f, indent=2)
+
+
+def load_binary_dataset(dataset_dir: str, mmap_mode: str = 'r') -> Dict[str, np.ndarray]:
+    """
+    Load a binary dataset written by `save_binary_dataset`
+    
+    Args:
+        dataset_dir: Dataset directory
+        mmap_mode: Memory-map mode passed to np.load (None reads into memory)
+    
+    Returns:
+        Dictionary of column arrays
+    """
+    with open(os.path.join(dataset_dir, 'dataset.json'), 'r') as f:
+        info = json.load(f)
+    
+    if info.get('format_version') != BINARY_DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary dataset format: {info.get('format_version')}")
+    
+    return {
+        name: np.load(os.path.join(dataset_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in info['columns']
+    }
+
+
+def convert_csv_to_binary(csv_path: str, output_dir: str, chunk_size: int = PARSE_CHUNK_SIZE):
+    """
+    Convert a CSV dataset with comma-joined voltammetry strings to the binary format
+    
+    Args:
+        csv_path: Path to CSV file
+        output_dir: Output dataset directory
+        chunk_size: Number of CSV rows parsed at a time
+    """
+    import pandas as pd
+    
+    chunks = []
+    for df in pd.read_csv(csv_path, chunksize=chunk_size):
+        signals, lengths = parse_voltammetry_column(df['voltammetry'])
+        chunks.append({
+            'dravya': df['dravya'].to_numpy(dtype=str),
+            'ph': df['ph'].to_numpy(dtype=np.float64),
+            'conductivity': df['conductivity'].to_numpy(dtype=np.float64),
+            'temperature': df['temperature'].to_numpy(dtype=np.float64),
+            'voltammetry': signals.astype(np.float32),
+            'voltammetry_lengths': lengths,
+        })
+    
+    if not chunks:
+        raise ValueError(f"Dataset is empty: {csv_path}")
+    
+    # Chunks may have different signal widths if lengths are ragged
+    width = max(c['voltammetry'].shape[1] for c in chunks)
+    for c in chunks:
+        pad = width - c['voltammetry'].shape[1]
+        if pad:
+            c['voltammetry'] = np.pad(c['voltammetry'], ((0, 0), (0, pad)),
+                                      constant_values=np.nan)
+    
+    save_binary_dataset(output_dir, {
+        name: np.concatenate([c[name] for c in chunks])
+        for name in BINARY_DATASET_COLUMNS
+    })
+
+
+def load_dataset(path: str) -> Dict[str, np.ndarray]:
+    """
+    Load a dataset from either a CSV file or a binary dataset directory
+    
+    Args:
+        path: Path to CSV file or binary dataset directory
+    
+    Returns:
+        Dictionary of column arrays ('dravya', 'ph', 'conductivity',
+        'temperature', 'voltammetry', 'voltammetry_lengths')
+    """
+    if is_binary_dataset(path):
+        return load_binary_dataset(path)
+    
+    import pandas as pd
+    df = pd.read_csv(path)
+    signals, lengths = parse_voltammetry_column(df['voltammetry'])
+    return {
+        'dravya': df['dravya'].to_numpy(),
+        'ph': df['ph'].to_numpy(dtype=np.float64),
+        'conductivity': df['conductivity'].to_numpy(dtype=np.float64),
+        'temperature': df['temperature'].to_numpy(dtype=np.float64),
+        'voltammetry': signals,
+        'voltammetry_lengths': lengths,
+    }
+
+
+def iter_dataset_chunks(path: str,
+                        chunk_size: int = PARSE_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Stream raw features and labels from a dataset a chunk of rows at a time
+    
+    Args:
+        path: Path to CSV file or binary dataset directory
+        chunk_size: Number of rows per chunk
+    
+    Yields:
+        Unscaled feature matrix (n_rows, n_features) and labels for each chunk
+    """
+    preprocessor = DataPreprocessor()
+    
+    if is_binary_dataset(path):
+        dataset = load_binary_dataset(path)
+        n_samples = len(dataset['ph'])
+        for start in range(0, n_samples, chunk_size):
+            chunk = {name: column[start:start + chunk_size] for name, column in dataset.items()}
+            yield preprocessor.extract_features_from_arrays(chunk), np.asarray(chunk['dravya'])
+    else:
+        import pandas as pd
+        for df in pd.read_csv(path, chunksize=chunk_size):
+            yield preprocessor.extract_features_from_dataframe(df), df['dravya'].to_numpy()
+
+
 def load_and_preprocess_data(csv_path: str, 
                             preprocessor: DataPreprocessor = None) -> Tuple[np.ndarray, np.ndarray, DataPreprocessor]:
     """
     Load CSV data and preprocess it
     
     Args:
-        csv_path: Path to CSV file
+        csv_path: Path to CSV file or binary dataset directory
         preprocessor: Optional preprocessor (if None, creates new one)
     
     Returns:
         X (features), y (labels), preprocessor
     """
-    # Load data
-    df = pd.read_csv(csv_path)
-    
     # Create preprocessor if not provided
     if preprocessor is None:
         preprocessor = DataPreprocessor()
     
     # Extract features and labels
-    X = preprocessor.extract_features_from_dataframe(df)
-    y = df['dravya'].values
+    if is_binary_dataset(csv_path):
+        dataset = load_binary_dataset(csv_path)
+        X = preprocessor.extract_features_from_arrays(dataset)
+        y = np.asarray(dataset['dravya'])
+    else:
+        import pandas as pd
+        df = pd.read_csv(csv_path)
+        X = preprocessor.extract_features_from_dataframe(df)
+        y = df['dravya'].values
     
     # Fit and transform
     X_scaled, y_encoded = preprocessor.fit_transform(X, y)
     
     return X_scaled, y_encoded, preprocessor
 
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Convert a CSV dataset to the binary (memory-mappable) format"
+    )
+    parser.add_argument('csv_path', help='Input CSV dataset')
+    parser.add_argument('output_dir', help='Output binary dataset directory')
+    parser.add_argument('--chunk-size', type=int, default=PARSE_CHUNK_SIZE,
+                        help='Number of CSV rows parsed at a time')
+    args = parser.parse_args()
+    
+    convert_csv_to_binary(args.csv_path, args.output_dir, chunk_size=args.chunk_size)
+    print(f"Binary dataset saved to: {args.output_dir}")
@@ -4,17 +4,34 @@ Train ML models for E-Tongue Dravya identification
 This script trains multiple ML models and selects the best one.
 """
 import numpy as np
-import pandas as pd
 from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.svm import SVC
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import SGDClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.naive_bayes import GaussianNB
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from joblib.externals.loky import get_reusable_executor
+from typing import Dict, List, Optional
 import pickle
+import argparse
+import json
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
+import time
 
 # Import custom modules
-from preprocess import load_and_preprocess_data, DataPreprocessor
+from preprocess import iter_dataset_chunks, DataPreprocessor, FEATURE_NAMES
+from feature_cache import FeatureCache, load_features
+from export_onnx import export_model
+from compiled_forest import COMPILED_FOREST_DIR, CompiledForest
 from utils import (
     save_model, generate_evaluation_report, 
     save_evaluation_report, create_confusion_matrix_plot
@@ -22,6 +39,7 @@ from utils import (
 
 # Optional: TensorFlow/Keras for CNN
 try:
+    import tensorflow as tf
     from tensorflow import keras
     from tensorflow.keras import layers
     TENSORFLOW_AVAILABLE = True
@@ -57,7 +75,43 @@ def build_cnn_model(input_shape: tuple, num_classes: int):
     return model
 
 
-def train_random_forest(X_train, y_train, X_val, y_val):
+SEARCH_STRATEGIES = ['grid', 'halving']
+
+
+def make_search(estimator, param_grid: dict, search: str = 'grid',
+                resource: str = 'n_samples', n_jobs: int = -1, **halving_params):
+    """
+    Build a hyperparameter search over `param_grid`
+    
+    'grid' evaluates every candidate on the full training set. 'halving' runs
+    successive halving: all candidates start with a small budget of
+    `resource` (training samples or, e.g., 'n_estimators'), and only the best
+    1/factor of them advance to the next round with factor times the budget.
+    
+    Args:
+        estimator: Base estimator
+        param_grid: Parameter grid (without the resource parameter for 'halving')
+        search: 'grid' or 'halving'
+        resource: Budget allocated per round with 'halving'
+        n_jobs: Number of parallel fits
+        **halving_params: Extra HalvingGridSearchCV arguments (factor,
+            min_resources, max_resources, ...)
+    """
+    if search == 'grid':
+        return GridSearchCV(
+            estimator, param_grid, cv=3,
+            scoring='accuracy', n_jobs=n_jobs, verbose=1
+        )
+    if search == 'halving':
+        return HalvingGridSearchCV(
+            estimator, param_grid, cv=3, resource=resource,
+            scoring='accuracy', n_jobs=n_jobs, verbose=1,
+            random_state=42, **halving_params
+        )
+    raise ValueError(f"Unknown search strategy: {search}")
+
+
+def train_random_forest(X_train, y_train, X_val, y_val, search: str = 'grid', n_jobs: int = -1):
     """Train Random Forest classifier"""
     print("\n" + "="*60)
     print("Training Random Forest Classifier...")
@@ -70,15 +124,23 @@ def train_random_forest(X_train, y_train, X_val, y_val):
         'min_samples_split': [2, 5]
     }
     
-    rf_base = RandomForestClassifier(random_state=42, n_jobs=-1)
-    grid_search = GridSearchCV(
-        rf_base, param_grid, cv=3, 
-        scoring='accuracy', n_jobs=-1, verbose=1
-    )
+    # With a core budget, parallelize across search fits only, not inside each forest
+    rf_base = RandomForestClassifier(random_state=42, n_jobs=-1 if n_jobs == -1 else 1)
+    if search == 'halving':
+        # Budget by number of trees, doubling each round up to 200 in the last one
+        param_grid.pop('n_estimators')
+        grid_search = make_search(
+            rf_base, param_grid, search, resource='n_estimators',
+            factor=2, min_resources='exhaust', max_resources=200, n_jobs=n_jobs
+        )
+    else:
+        grid_search = make_search(rf_base, param_grid, search, n_jobs=n_jobs)
     
     grid_search.fit(X_train, y_train)
     
     best_rf = grid_search.best_estimator_
+    # Stay within the core budget; only the sequential path (-1) uses every core
+    best_rf.set_params(n_jobs=n_jobs)
     print(f"Best parameters: {grid_search.best_params_}")
     
     # Evaluate
@@ -94,8 +156,32 @@ def train_random_forest(X_train, y_train, X_val, y_val):
     return best_rf, val_acc
 
 
-def train_svm(X_train, y_train, X_val, y_val):
-    """Train SVM classifier"""
+def calibrate_classifier(estimator, X_calib, y_calib, method: str = 'sigmoid'):
+    """
+    Add predict_proba to an already fitted classifier
+    
+    Fits a probability calibrator (Platt 'sigmoid' or 'isotonic') on a held-out
+    split without refitting the classifier itself.
+    """
+    try:
+        # scikit-learn >= 1.6
+        from sklearn.frozen import FrozenEstimator
+        calibrated = CalibratedClassifierCV(FrozenEstimator(estimator), method=method)
+    except ImportError:
+        calibrated = CalibratedClassifierCV(estimator, method=method, cv='prefit')
+    
+    return calibrated.fit(X_calib, y_calib)
+
+
+def train_svm(X_train, y_train, X_val, y_val, search: str = 'grid',
+              calibration: str = 'sigmoid', calibration_size: float = 0.2, n_jobs: int = -1):
+    """
+    Train SVM classifier
+    
+    The search fits plain SVCs (no internal cross-validated Platt scaling per
+    candidate); only the winning configuration is refitted and calibrated on a
+    held-out part of the training set, so the saved model has predict_proba.
+    """
     print("\n" + "="*60)
     print("Training SVM Classifier...")
     print("="*60)
@@ -107,17 +193,28 @@ def train_svm(X_train, y_train, X_val, y_val):
         'gamma': ['scale', 'auto']
     }
     
-    svm_base = SVC(random_state=42, probability=True)
-    grid_search = GridSearchCV(
-        svm_base, param_grid, cv=3,
-        scoring='accuracy', n_jobs=-1, verbose=1
-    )
+    svm_base = SVC(random_state=42)
+    if search == 'halving':
+        # Budget by training samples; the last round uses the whole training set
+        grid_search = make_search(svm_base, param_grid, search, resource='n_samples',
+                                  factor=3, n_jobs=n_jobs)
+    else:
+        grid_search = make_search(svm_base, param_grid, search, n_jobs=n_jobs)
     
+    # Search on plain SVCs; the refit of the winner happens below
+    grid_search.set_params(refit=False)
     grid_search.fit(X_train, y_train)
-    
-    best_svm = grid_search.best_estimator_
     print(f"Best parameters: {grid_search.best_params_}")
     
+    # Calibration stage: refit the winner on part of the training set and fit
+    # a probability calibrator on the held-out rest
+    print(f"Calibrating best SVM ({calibration})...")
+    X_fit, X_calib, y_fit, y_calib = train_test_split(
+        X_train, y_train, test_size=calibration_size, random_state=42, stratify=y_train
+    )
+    svm = SVC(random_state=42, **grid_search.best_params_).fit(X_fit, y_fit)
+    best_svm = calibrate_classifier(svm, X_calib, y_calib, method=calibration)
+    
     # Evaluate
     train_pred = best_svm.predict(X_train)
     val_pred = best_svm.predict(X_val)
@@ -131,28 +228,25 @@ def train_svm(X_train, y_train, X_val, y_val):
     return best_svm, val_acc
 
 
-def train_cnn(X_train, y_train, X_val, y_val, preprocessor, df_train):
+def train_cnn(X_train, y_train, X_val, y_val, volt_train, volt_val, n_jobs: int = -1):
     """Train 1D CNN on voltammetry time-series data"""
     if not TENSORFLOW_AVAILABLE:
         return None, 0.0
     
+    if n_jobs != -1:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(n_jobs)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            # Thread pools are fixed once TensorFlow has started executing ops
+            pass
+    
     print("\n" + "="*60)
     print("Training 1D CNN Classifier...")
     print("="*60)
     
-    # Extract voltammetry signals for CNN
-    def extract_voltammetry(df):
-        signals = []
-        for idx, row in df.iterrows():
-            if isinstance(row['voltammetry'], str):
-                signal = np.array([float(x) for x in row['voltammetry'].split(',')])
-            else:
-                signal = np.array(row['voltammetry'])
-            signals.append(signal)
-        return np.array(signals)
-    
-    X_train_volt = extract_voltammetry(df_train.iloc[:len(X_train)])
-    X_val_volt = extract_voltammetry(df_train.iloc[len(X_train):len(X_train)+len(X_val)])
+    X_train_volt = np.asarray(volt_train, dtype=np.float64)
+    X_val_volt = np.asarray(volt_val, dtype=np.float64)
     
     # Normalize signals
     X_train_volt = (X_train_volt - X_train_volt.mean()) / (X_train_volt.std() + 1e-8)
@@ -184,113 +278,252 @@ def train_cnn(X_train, y_train, X_val, y_val, preprocessor, df_train):
     return cnn_model, val_acc
 
 
-def main():
-    """Main training pipeline"""
-    print("="*60)
-    print("E-Tongue ML Model Training Pipeline")
+# Estimators supporting partial_fit and predict_proba, for out-of-core training
+INCREMENTAL_MODELS = {
+    'sgd': lambda seed: SGDClassifier(loss='log_loss', alpha=1e-4, random_state=seed),
+    'mlp': lambda seed: MLPClassifier(hidden_layer_sizes=(64, 32), random_state=seed),
+    'naive_bayes': lambda seed: GaussianNB(),
+}
+
+
+def train_out_of_core(dataset_path: str, model_type: str = 'sgd', chunk_size: int = 100_000,
+                      n_epochs: int = 5, validation_fraction: float = 0.1,
+                      max_validation_samples: int = 200_000, seed: int = 42):
+    """
+    Train an incremental classifier on a dataset streamed in chunks
+    
+    Pass 1 streams the dataset once, fits the preprocessor with partial_fit and
+    spills the 11-feature matrix to a temporary file. Each epoch then reads
+    the spilled features chunk by chunk and calls partial_fit on the model.
+    Every k-th row (k = 1 / validation_fraction) is held out for validation.
+    Memory stays bounded by `chunk_size` and `max_validation_samples`.
+    
+    Returns:
+        (model, preprocessor, y_val, val_pred)
+    """
+    print("\n" + "="*60)
+    print(f"Out-of-core training ({model_type}, chunk size {chunk_size})...")
     print("="*60)
     
-    # Load and preprocess data
-    dataset_path = 'synthetic_dataset.csv'
-    if not os.path.exists(dataset_path):
-        print(f"Error: Dataset not found at {dataset_path}")
-        print("Please run generate_dataset.py first!")
-        sys.exit(1)
-    
-    print("\nLoading and preprocessing data...")
-    X, y, preprocessor = load_and_preprocess_data(dataset_path)
-    
-    # Load original dataframe for CNN
-    df = pd.read_csv(dataset_path)
+    if model_type == 'naive_bayes':
+        # GaussianNB accumulates counts; a second pass would count rows twice
+        n_epochs = 1
     
-    print(f"Dataset shape: {X.shape}")
-    print(f"Number of classes: {len(np.unique(y))}")
-    print(f"Class names: {preprocessor.get_class_names()}")
-    
-    # Split data
-    X_train, X_temp, y_train, y_temp = train_test_split(
-        X, y, test_size=0.3, random_state=42, stratify=y
-    )
-    X_val, X_test, y_val, y_test = train_test_split(
-        X_temp, y_temp, test_size=0.5, random_state=42, stratify=y_temp
-    )
+    val_every = max(2, int(round(1 / validation_fraction)))
+    preprocessor = DataPreprocessor()
+    preprocessor.feature_names = list(FEATURE_NAMES)
+    label_codes = {}
     
-    print(f"\nData split:")
-    print(f"Train: {len(X_train)} samples")
-    print(f"Validation: {len(X_val)} samples")
-    print(f"Test: {len(X_test)} samples")
+    with tempfile.TemporaryDirectory(prefix='etongue_ooc_') as spill_dir:
+        features_path = os.path.join(spill_dir, 'features.bin')
+        labels_path = os.path.join(spill_dir, 'labels.bin')
+        
+        # Pass 1: fit preprocessor and spill features
+        n_rows = 0
+        with open(features_path, 'wb') as features_file, open(labels_path, 'wb') as labels_file:
+            for X_chunk, y_chunk in iter_dataset_chunks(dataset_path, chunk_size):
+                preprocessor.partial_fit(X_chunk, y_chunk)
+                
+                chunk_labels, inverse = np.unique(y_chunk, return_inverse=True)
+                codes = np.array([label_codes.setdefault(label, len(label_codes))
+                                  for label in chunk_labels], dtype=np.int32)
+                features_file.write(np.ascontiguousarray(X_chunk, dtype=np.float64).tobytes())
+                labels_file.write(codes[inverse].tobytes())
+                
+                n_rows += len(X_chunk)
+                print(f"Pass 1: {n_rows} rows read")
+        
+        if n_rows == 0:
+            raise ValueError(f"Dataset is empty: {dataset_path}")
+        
+        features = np.memmap(features_path, dtype=np.float64, mode='r',
+                             shape=(n_rows, len(preprocessor.feature_names)))
+        codes = np.memmap(labels_path, dtype=np.int32, mode='r', shape=(n_rows,))
+        
+        # Map first-seen label codes to label encoder order
+        class_names = preprocessor.get_class_names()
+        code_to_class = np.empty(len(label_codes), dtype=np.int64)
+        for label, code in label_codes.items():
+            code_to_class[code] = class_names.index(label)
+        classes = np.arange(len(class_names))
+        
+        model = INCREMENTAL_MODELS[model_type](seed)
+        rng = np.random.default_rng(seed)
+        
+        for epoch in range(n_epochs):
+            n_trained = 0
+            for start in range(0, n_rows, chunk_size):
+                stop = min(start + chunk_size, n_rows)
+                train_rows = np.arange(start, stop)
+                train_rows = train_rows[train_rows % val_every != 0]
+                if len(train_rows) == 0:
+                    continue
+                
+                # Shuffle within the chunk (rows are already shuffled globally)
+                train_rows = train_rows[rng.permutation(len(train_rows))] - start
+                X_chunk = preprocessor.transform(features[start:stop])[train_rows]
+                y_chunk = code_to_class[codes[start:stop]][train_rows]
+                model.partial_fit(X_chunk, y_chunk, classes=classes)
+                
+                n_trained += len(train_rows)
+            print(f"Epoch {epoch + 1}/{n_epochs}: {n_trained} rows trained")
+        
+        # Validation on held-out rows
+        val_rows = np.arange(0, n_rows, val_every)[:max_validation_samples]
+        X_val = preprocessor.transform(features[val_rows])
+        y_val = code_to_class[codes[val_rows]]
+        del features, codes
     
-    # Split dataframe for CNN
-    train_idx = len(X_train)
-    val_idx = train_idx + len(X_val)
-    df_train = df.iloc[:train_idx]
-    df_val = df.iloc[train_idx:val_idx]
+    val_pred = model.predict(X_val)
+    print(f"Validation Accuracy: {accuracy_score(y_val, val_pred):.4f} "
+          f"({len(val_rows)} held-out rows)")
     
-    # Train models
+    return model, preprocessor, y_val, val_pred
+
+
+def split_cores(families: List[str], n_cores: int) -> Dict[str, int]:
+    """Split a core budget evenly between model families (at least one core each)"""
+    base, extra = divmod(n_cores, len(families))
+    return {
+        family: max(1, base + (1 if i < extra else 0))
+        for i, family in enumerate(families)
+    }
+
+
+def train_families_sequential(X_train, y_train, X_val, y_val, volt_train, volt_val,
+                              search: str = 'grid', calibration: str = 'sigmoid'):
+    """
+    Train all model families one after another, each using every core
+    
+    Returns:
+        (models, scores) dictionaries keyed by family name
+    """
     models = {}
     scores = {}
     
     # Random Forest
-    rf_model, rf_score = train_random_forest(X_train, y_train, X_val, y_val)
+    rf_model, rf_score = train_random_forest(X_train, y_train, X_val, y_val, search=search)
     models['random_forest'] = rf_model
     scores['random_forest'] = rf_score
     
     # SVM
-    svm_model, svm_score = train_svm(X_train, y_train, X_val, y_val)
+    svm_model, svm_score = train_svm(
+        X_train, y_train, X_val, y_val, search=search, calibration=calibration
+    )
     models['svm'] = svm_model
     scores['svm'] = svm_score
     
     # CNN (optional)
     if TENSORFLOW_AVAILABLE:
         try:
-            cnn_model, cnn_score = train_cnn(X_train, y_train, X_val, y_val, preprocessor, df)
+            cnn_model, cnn_score = train_cnn(
+                X_train, y_train, X_val, y_val, volt_train, volt_val
+            )
             if cnn_model is not None:
                 models['cnn'] = cnn_model
                 scores['cnn'] = cnn_score
         except Exception as e:
             print(f"CNN training failed: {e}")
     
-    # Select best model
-    best_model_name = max(scores, key=scores.get)
-    best_model = models[best_model_name]
-    best_score = scores[best_model_name]
-    
-    print("\n" + "="*60)
-    print("MODEL COMPARISON")
-    print("="*60)
-    for name, score in scores.items():
-        marker = " <-- BEST" if name == best_model_name else ""
-        print(f"{name}: {score:.4f}{marker}")
+    return models, scores
+
+
+def _train_in_worker(train_fn, *args, **kwargs):
+    """
+    Run one family's training function in a pool worker process
+    
+    The search inside starts joblib's reusable process pool, whose idle
+    workers otherwise outlive the task by several minutes and keep the outer
+    pool from shutting down. It is shut down before the result is returned.
+    """
+    try:
+        return train_fn(*args, **kwargs)
+    finally:
+        get_reusable_executor().shutdown(wait=True)
+
+
+def train_families_parallel(X_train, y_train, X_val, y_val, volt_train, volt_val,
+                            search: str = 'grid', calibration: str = 'sigmoid',
+                            n_cores: Optional[int] = None):
+    """
+    Train all model families concurrently on the same split
+    
+    Random Forest and SVM run in separate worker processes; the CNN (if
+    TensorFlow is available) runs in a thread of this process, since
+    TensorFlow does not survive being forked. Each family gets an even share
+    of `n_cores` as its internal n_jobs so they do not oversubscribe the CPU.
+    Scores are collected as each family finishes. With a single core there
+    is nothing to overlap, so the families are trained sequentially instead.
+    
+    Returns:
+        (models, scores) dictionaries keyed by family name
+    """
+    n_cores = n_cores or os.cpu_count() or 1
+    if n_cores < 2:
+        print("\nOnly one core available; training model families sequentially")
+        return train_families_sequential(X_train, y_train, X_val, y_val, volt_train, volt_val,
+                                         search=search, calibration=calibration)
+    
+    families = ['random_forest', 'svm'] + (['cnn'] if TENSORFLOW_AVAILABLE else [])
+    budget = split_cores(families, n_cores)
     
-    # Evaluate best model on test set
     print("\n" + "="*60)
-    print(f"Evaluating best model ({best_model_name}) on test set...")
+    print("Training model families in parallel...")
     print("="*60)
+    for family, cores in budget.items():
+        print(f"{family}: {cores} core(s)")
     
-    if best_model_name == 'cnn':
-        # For CNN, use voltammetry signals
-        X_test_volt = []
-        for idx in range(len(X_test)):
-            row = df.iloc[val_idx + idx]
-            if isinstance(row['voltammetry'], str):
-                signal = np.array([float(x) for x in row['voltammetry'].split(',')])
-            else:
-                signal = np.array(row['voltammetry'])
-            X_test_volt.append(signal)
-        X_test_volt = np.array(X_test_volt)
-        X_test_volt = (X_test_volt - X_test_volt.mean()) / (X_test_volt.std() + 1e-8)
-        X_test_volt = X_test_volt.reshape(X_test_volt.shape[0], X_test_volt.shape[1], 1)
+    models = {}
+    scores = {}
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as processes, \
+            ThreadPoolExecutor(max_workers=1) as threads:
+        futures = {
+            processes.submit(_train_in_worker, train_random_forest, X_train, y_train, X_val, y_val,
+                             search=search, n_jobs=budget['random_forest']): 'random_forest',
+            processes.submit(_train_in_worker, train_svm, X_train, y_train, X_val, y_val,
+                             search=search, calibration=calibration,
+                             n_jobs=budget['svm']): 'svm',
+        }
+        if 'cnn' in budget:
+            futures[threads.submit(train_cnn, X_train, y_train, X_val, y_val,
+                                   volt_train, volt_val, n_jobs=budget['cnn'])] = 'cnn'
         
-        test_pred_proba = best_model.predict(X_test_volt)
-        test_pred = np.argmax(test_pred_proba, axis=1)
-    else:
-        test_pred = best_model.predict(X_test)
-    
+        for future in as_completed(futures):
+            family = futures[future]
+            try:
+                model, score = future.result()
+            except Exception as e:
+                print(f"{family} training failed: {e}")
+                continue
+            if model is None:
+                continue
+            models[family] = model
+            scores[family] = score
+            print(f"{family} finished: validation accuracy {score:.4f} "
+                  f"({time.perf_counter() - started:.1f}s)")
+    
+    if not models:
+        raise RuntimeError("All model families failed to train")
+    
+    return models, scores
+
+
+def save_training_outputs(best_model, best_model_name: str, preprocessor: DataPreprocessor,
+                          y_test, test_pred, scores: dict, eval_split: str = 'test'):
+    """
+    Evaluate the chosen model and save all training artifacts
+    
+    Args:
+        eval_split: Which held-out split y_test comes from ('test' or
+            'validation'); the accuracy is saved as '<eval_split>_accuracy'
+    """
     # Generate evaluation report
     class_names = preprocessor.get_class_names()
     eval_report = generate_evaluation_report(y_test, test_pred, class_names)
     
-    print(f"\nTest Set Results:")
+    print(f"\n{eval_split.capitalize()} Set Results:")
     print(f"Accuracy: {eval_report['accuracy']:.4f}")
     print(f"Precision: {eval_report['precision']:.4f}")
     print(f"Recall: {eval_report['recall']:.4f}")
@@ -300,6 +533,15 @@ def main():
     print("\nSaving model and preprocessor...")
     save_model(best_model, 'model.pkl')
     preprocessor.save('preprocessor.pkl')
+    if best_model_name != 'cnn':
+        # Memory-mappable copies, preferred by the API when present
+        save_model(best_model, 'model.joblib')
+        preprocessor.save('preprocessor.joblib')
+    if isinstance(best_model, RandomForestClassifier):
+        # Node arrays the API memory-maps instead of unpickling the forest
+        CompiledForest.from_sklearn(best_model).save(COMPILED_FOREST_DIR)
+    else:
+        shutil.rmtree(COMPILED_FOREST_DIR, ignore_errors=True)
     
     # Save evaluation report
     save_evaluation_report(eval_report, 'evaluation_report.json')
@@ -314,24 +556,217 @@ def main():
     print("="*60)
     print(f"Best model: {best_model_name} (saved as model.pkl)")
     print(f"Preprocessor saved as: preprocessor.pkl")
+    if isinstance(best_model, RandomForestClassifier):
+        print(f"Compiled forest saved in: {COMPILED_FOREST_DIR}/")
     print(f"Evaluation report saved as: evaluation_report.json")
     print(f"Confusion matrix saved as: confusion_matrix.png")
     
-    # Save model metadata
+    # Save model metadata last: the API's model watcher only reloads once it
+    # is at least as new as the model files
     metadata = {
         'model_name': best_model_name,
-        'test_accuracy': float(eval_report['accuracy']),
+        f'{eval_split}_accuracy': float(eval_report['accuracy']),
         'class_names': class_names,
         'feature_names': preprocessor.feature_names,
         'all_scores': {k: float(v) for k, v in scores.items()}
     }
-    import json
     with open('model_metadata.json', 'w') as f:
         json.dump(metadata, f, indent=2)
     
     print(f"Model metadata saved as: model_metadata.json")
 
 
+def main():
+    """Main training pipeline"""
+    parser = argparse.ArgumentParser(
+        description="Train E-Tongue Dravya identification models"
+    )
+    parser.add_argument(
+        '--dataset',
+        default=None,
+        help='CSV file or binary dataset directory '
+             '(default: synthetic_dataset_npy if present, else synthetic_dataset.csv)'
+    )
+    parser.add_argument(
+        '--search',
+        choices=SEARCH_STRATEGIES,
+        default='grid',
+        help="Hyperparameter search: exhaustive 'grid' or successive 'halving'"
+    )
+    parser.add_argument(
+        '--svm-calibration',
+        choices=['sigmoid', 'isotonic'],
+        default='sigmoid',
+        help='Probability calibration applied to the best SVM'
+    )
+    parser.add_argument(
+        '--parallel',
+        action='store_true',
+        help='Train the model families concurrently in a process pool'
+    )
+    parser.add_argument(
+        '--n-jobs',
+        type=int,
+        default=None,
+        help='Total cores shared by the model families with --parallel (default: all)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the extracted-feature cache'
+    )
+    parser.add_argument(
+        '--clear-cache',
+        action='store_true',
+        help='Drop all cached features before loading'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default='.feature_cache',
+        help='Directory of the extracted-feature cache'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=2048,
+        help='Size limit of the feature cache; least recently used entries are evicted'
+    )
+    parser.add_argument(
+        '--out-of-core',
+        action='store_true',
+        help='Stream the dataset in chunks and train an incremental model '
+             '(for datasets larger than memory)'
+    )
+    parser.add_argument(
+        '--incremental-model',
+        choices=sorted(INCREMENTAL_MODELS),
+        default='sgd',
+        help='Incremental estimator used with --out-of-core'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=100_000,
+        help='Rows per chunk with --out-of-core'
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=5,
+        help='Passes over the dataset with --out-of-core'
+    )
+    parser.add_argument(
+        '--export-onnx',
+        action='store_true',
+        help='Also export the best model with its scaler to model.onnx (requires skl2onnx, or tf2onnx for the CNN)'
+    )
+    args = parser.parse_args()
+    
+    print("="*60)
+    print("E-Tongue ML Model Training Pipeline")
+    print("="*60)
+    
+    # Load and preprocess data
+    dataset_path = args.dataset
+    if dataset_path is None:
+        dataset_path = 'synthetic_dataset_npy' if os.path.isdir('synthetic_dataset_npy') else 'synthetic_dataset.csv'
+    if not os.path.exists(dataset_path):
+        print(f"Error: Dataset not found at {dataset_path}")
+        print("Please run generate_dataset.py first!")
+        sys.exit(1)
+    
+    if args.out_of_core:
+        model, preprocessor, y_val, val_pred = train_out_of_core(
+            dataset_path,
+            model_type=args.incremental_model,
+            chunk_size=args.chunk_size,
+            n_epochs=args.epochs
+        )
+        scores = {args.incremental_model: accuracy_score(y_val, val_pred)}
+        # Evaluated on the held-out validation rows; there is no separate test split
+        save_training_outputs(model, args.incremental_model, preprocessor, y_val, val_pred, scores,
+                              eval_split='validation')
+        if args.export_onnx:
+            export_model()
+        return
+    
+    print("\nLoading and preprocessing data...")
+    cache = None
+    if not args.no_cache:
+        cache = FeatureCache(args.cache_dir, max_size_bytes=args.cache_max_mb * 1024**2)
+        if args.clear_cache:
+            cache.clear()
+    dataset = load_features(dataset_path, cache)
+    preprocessor = DataPreprocessor()
+    preprocessor.feature_names = list(FEATURE_NAMES)
+    X, y = preprocessor.fit_transform(dataset['features'], dataset['labels'])
+    
+    print(f"Dataset shape: {X.shape}")
+    print(f"Number of classes: {len(np.unique(y))}")
+    print(f"Class names: {preprocessor.get_class_names()}")
+    
+    # Split data (row indices are split alongside so the CNN sees the same rows)
+    indices = np.arange(len(y))
+    X_train, X_temp, y_train, y_temp, idx_train, idx_temp = train_test_split(
+        X, y, indices, test_size=0.3, random_state=42, stratify=y
+    )
+    X_val, X_test, y_val, y_test, idx_val, idx_test = train_test_split(
+        X_temp, y_temp, idx_temp, test_size=0.5, random_state=42, stratify=y_temp
+    )
+    
+    print(f"\nData split:")
+    print(f"Train: {len(X_train)} samples")
+    print(f"Validation: {len(X_val)} samples")
+    print(f"Test: {len(X_test)} samples")
+    
+    # Voltammetry signal matrix for CNN
+    signals = dataset['voltammetry']
+    
+    # Train models
+    if args.parallel:
+        models, scores = train_families_parallel(
+            X_train, y_train, X_val, y_val, signals[idx_train], signals[idx_val],
+            search=args.search, calibration=args.svm_calibration, n_cores=args.n_jobs
+        )
+    else:
+        models, scores = train_families_sequential(
+            X_train, y_train, X_val, y_val, signals[idx_train], signals[idx_val],
+            search=args.search, calibration=args.svm_calibration
+        )
+    
+    # Select best model
+    best_model_name = max(scores, key=scores.get)
+    best_model = models[best_model_name]
+    best_score = scores[best_model_name]
+    
+    print("\n" + "="*60)
+    print("MODEL COMPARISON")
+    print("="*60)
+    for name, score in scores.items():
+        marker = " <-- BEST" if name == best_model_name else ""
+        print(f"{name}: {score:.4f}{marker}")
+    
+    # Evaluate best model on test set
+    print("\n" + "="*60)
+    print(f"Evaluating best model ({best_model_name}) on test set...")
+    print("="*60)
+    
+    if best_model_name == 'cnn':
+        # For CNN, use voltammetry signals
+        X_test_volt = np.asarray(signals[idx_test], dtype=np.float64)
+        X_test_volt = (X_test_volt - X_test_volt.mean()) / (X_test_volt.std() + 1e-8)
+        X_test_volt = X_test_volt.reshape(X_test_volt.shape[0], X_test_volt.shape[1], 1)
+        
+        test_pred_proba = best_model.predict(X_test_volt)
+        test_pred = np.argmax(test_pred_proba, axis=1)
+    else:
+        test_pred = best_model.predict(X_test)
+    
+    save_training_outputs(best_model, best_model_name, preprocessor, y_test, test_pred, scores)
+    if args.export_onnx:
+        export_model()
+
+
 if __name__ == "__main__":
     main()
 
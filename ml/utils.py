@@ -2,20 +2,34 @@
 Utility functions for E-Tongue ML pipeline
 """
 import numpy as np
-import pandas as pd
 from typing import Dict, List, Tuple
 import pickle
 import json
 
 
-def load_model(model_path: str):
-    """Load a saved model from pickle file"""
+def load_model(model_path: str, mmap_mode: str = None):
+    """
+    Load a saved model from pickle or joblib (.joblib) file
+    
+    Args:
+        model_path: Path to model file
+        mmap_mode: For .joblib files, memory-map the model's NumPy arrays
+            (e.g. 'r'), so processes loading the same file share its pages
+    """
+    if model_path.endswith('.joblib'):
+        import joblib
+        return joblib.load(model_path, mmap_mode=mmap_mode)
     with open(model_path, 'rb') as f:
         return pickle.load(f)
 
 
 def save_model(model, model_path: str):
-    """Save a model to pickle file"""
+    """Save a model to pickle file, or to joblib format if the path ends in .joblib"""
+    if model_path.endswith('.joblib'):
+        import joblib
+        # Uncompressed, so arrays can be memory-mapped on load
+        joblib.dump(model, model_path)
+        return
     with open(model_path, 'wb') as f:
         pickle.dump(model, f)
 
@@ -58,6 +72,97 @@ def extract_features(data: Dict) -> np.ndarray:
     return np.array(features).reshape(1, -1)
 
 
+def stack_signals(signals: List[List[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack voltammetry signals into a single 2-D matrix
+    
+    Signals shorter than the longest one are right-padded with NaN.
+    
+    Args:
+        signals: List of voltammetry signals (possibly of different lengths)
+    
+    Returns:
+        Signal matrix (n_samples, max_length) and array of signal lengths
+    """
+    lengths = np.array([len(s) for s in signals], dtype=np.int64)
+    max_length = int(lengths.max()) if len(lengths) > 0 else 0
+    
+    if len(lengths) > 0 and np.all(lengths == max_length):
+        return np.asarray(signals, dtype=np.float64).reshape(len(signals), max_length), lengths
+    
+    matrix = np.full((len(signals), max_length), np.nan)
+    for i, signal in enumerate(signals):
+        matrix[i, :lengths[i]] = signal
+    return matrix, lengths
+
+
+def voltammetry_statistics(signals: np.ndarray, lengths: np.ndarray = None) -> np.ndarray:
+    """
+    Compute the 8 voltammetry features for a batch of signals in one pass
+    
+    Produces the same values as the per-signal statistics in `extract_features`.
+    Rows of different lengths are grouped by length, so each group is reduced
+    along axis 1 without touching the NaN padding.
+    
+    Args:
+        signals: Signal matrix (n_samples, n_points)
+        lengths: Optional number of valid points per row (defaults to all points)
+    
+    Returns:
+        Feature matrix (n_samples, 8)
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    n_samples, n_points = signals.shape
+    features = np.zeros((n_samples, 8))
+    
+    if lengths is None:
+        lengths = np.full(n_samples, n_points, dtype=np.int64)
+    
+    for length in np.unique(lengths):
+        if length == 0:
+            # Default values if voltammetry is missing
+            continue
+        
+        rows = np.flatnonzero(lengths == length)
+        block = signals[:, :length] if len(rows) == n_samples else signals[rows, :length]
+        q1, q3 = np.percentile(block, [25, 75], axis=1)
+        
+        features[rows] = np.column_stack([
+            np.mean(block, axis=1),
+            np.std(block, axis=1),
+            np.max(block, axis=1),
+            np.min(block, axis=1),
+            np.median(block, axis=1),
+            q1,
+            q3,
+            np.sum(np.abs(np.diff(block, axis=1)), axis=1),
+        ])
+    
+    return features
+
+
+def extract_features_batch(data: List[Dict]) -> np.ndarray:
+    """
+    Extract features from a batch of sensor data dictionaries
+    
+    Vectorized equivalent of calling `extract_features` on every reading.
+    
+    Args:
+        data: List of dictionaries with keys 'ph', 'conductivity', 'temperature', 'voltammetry'
+    
+    Returns:
+        Feature matrix (n_samples, 11), rows in input order
+    """
+    basic = np.array([
+        [d.get('ph', 7.0), d.get('conductivity', 0.0), d.get('temperature', 25.0)]
+        for d in data
+    ], dtype=np.float64).reshape(len(data), 3)
+    
+    signals, lengths = stack_signals([d.get('voltammetry') or [] for d in data])
+    
+    return np.hstack([basic, voltammetry_statistics(signals, lengths)])
+
+
 def create_confusion_matrix_plot(y_true, y_pred, class_names, save_path: str):
     """Create and save confusion matrix visualization"""
     from sklearn.metrics import confusion_matrix
@@ -0,0 +1,84 @@
+"""
+Tests for the inference executor and micro-batcher
+"""
+import asyncio
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'backend'))
+
+from inference import InferenceExecutor, MicroBatcher
+
+
+class RejectingPredictor:
+    """Returns one-hot rows, and fails the whole call if any reading is not finite"""
+    
+    class_names = ['a', 'b']
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def predict_proba(self, readings):
+        self.calls += 1
+        for reading in readings:
+            if not all(math.isfinite(value) for value in reading['voltammetry']):
+                raise ValueError("Input X contains infinity")
+        return np.array([[reading['ph'], 1.0 - reading['ph']] for reading in readings])
+
+
+def _reading(ph, voltammetry=(0.1, 0.2, 0.3)):
+    return {'ph': ph, 'conductivity': 1.0, 'temperature': 25.0, 'voltammetry': list(voltammetry)}
+
+
+def test_bad_reading_fails_only_its_own_request():
+    predictor = RejectingPredictor()
+    executor = InferenceExecutor(kind='thread', workers=1)
+    batcher = MicroBatcher(executor, window_ms=50, max_batch_size=64)
+    readings = [_reading(i / 20) for i in range(20)]
+    readings[7] = _reading(0.35, voltammetry=(0.1, float('inf')))
+    
+    async def run():
+        return await asyncio.gather(
+            *(batcher.predict_proba(predictor, reading) for reading in readings),
+            return_exceptions=True
+        )
+    
+    try:
+        results = asyncio.run(run())
+    finally:
+        batcher.shutdown()
+        executor.shutdown()
+    
+    assert isinstance(results[7], ValueError)
+    for i, row in enumerate(results):
+        if i != 7:
+            np.testing.assert_allclose(row, [i / 20, 1 - i / 20])
+    # One batched call, then one call per reading to isolate the failure
+    assert predictor.calls == 1 + len(readings)
+
+
+def test_sensor_data_rejects_non_finite_values():
+    pydantic = pytest.importorskip('pydantic')
+    from app import SensorData
+    
+    with pytest.raises(pydantic.ValidationError):
+        SensorData(**_reading(7.0, voltammetry=(0.1, float('inf'))))
+    with pytest.raises(pydantic.ValidationError):
+        SensorData(**_reading(7.0, voltammetry=(float('nan'),)))
+    assert SensorData(**_reading(7.0)).voltammetry == [0.1, 0.2, 0.3]
+
+
+def test_batch_rejects_more_than_max_readings():
+    pydantic = pytest.importorskip('pydantic')
+    from app import PREDICT_BATCH_MAX_READINGS, BatchSensorData
+    
+    readings = [_reading(7.0)] * PREDICT_BATCH_MAX_READINGS
+    assert len(BatchSensorData(readings=readings).readings) == PREDICT_BATCH_MAX_READINGS
+    with pytest.raises(pydantic.ValidationError):
+        BatchSensorData(readings=readings + [_reading(7.0)])
@@ -0,0 +1,44 @@
+"""
+Tests for the model training pipeline
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'ml'))
+
+pytest.importorskip('sklearn')
+
+import train_model
+
+
+def _split(n_samples: int, seed: int):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_samples, 11))
+    y = (X[:, 0] > 0).astype(int) + (X[:, 1] > 0.5).astype(int)
+    return X, y, rng.normal(size=(n_samples, 100))
+
+
+def test_parallel_training_is_not_slower_than_sequential():
+    X_train, y_train, volt_train = _split(1000, seed=0)
+    X_val, y_val, volt_val = _split(200, seed=1)
+    args = (X_train, y_train, X_val, y_val, volt_train, volt_val)
+    
+    started = time.perf_counter()
+    _, sequential_scores = train_model.train_families_sequential(*args, search='halving')
+    sequential_seconds = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    _, parallel_scores = train_model.train_families_parallel(*args, search='halving')
+    parallel_seconds = time.perf_counter() - started
+    
+    assert set(parallel_scores) == set(sequential_scores)
+    # Margin for timing noise only; workers left waiting on idle
+    # process pools used to add minutes
+    assert parallel_seconds <= sequential_seconds * 1.2, (
+        f"--parallel took {parallel_seconds:.1f}s, sequential {sequential_seconds:.1f}s"
+    )